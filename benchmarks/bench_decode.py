@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# Compares the old query_range decode path (response.json() plus json.loads per line)
+# with LogDecoder on the installed JSON backend and on the pure-python fallback.
+#
+#   python benchmarks/bench_decode.py [lines] [line_bytes]
+
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import lokicli.decoder as decoder
+from lokicli.decoder import LogDecoder
+
+def build_body(lines, line_bytes, streams=4):
+    payload = "x" * line_bytes
+    result = []
+    for stream in range(streams):
+        values = []
+        for i in range(lines // streams):
+            timestamp = str(1705881600000000000 - (i * streams + stream) * 1000)
+            values.append([timestamp, json.dumps({"log": f"{timestamp} INFO request {i} {payload}\n", "stream": "stdout", "time": "2024-01-22T00:00:00Z"})])
+        result.append({"stream": {"app": "metro", "pod": f"metro-{stream}"}, "values": values})
+    return json.dumps({"status": "success", "data": {"resultType": "streams", "result": result}}).encode()
+
+def old_decode(body):
+    result = json.loads(body.decode("utf-8"))["data"]["result"]
+    logs = []
+    for stream in result:
+        for item in stream["values"]:
+            logs.append({"log": json.loads(item[1])["log"], "timestamp": item[0]})
+    return logs
+
+def new_decode(body):
+    return list(LogDecoder.decode_response(body, "BACKWARD"))
+
+def fallback_decode(body):
+    fast_loads, fast_loads_line = decoder._loads, decoder._loads_line
+    decoder._loads, decoder._loads_line = json.loads, decoder._json_loads_line
+    try:
+        return new_decode(body)
+    finally:
+        decoder._loads, decoder._loads_line = fast_loads, fast_loads_line
+
+def measure(decoders, body, rounds=9):
+    # the decoders take turns every round, so a noisy machine slows all of them alike
+    best = [float("inf")] * len(decoders)
+    for _ in range(rounds):
+        for index, decode in enumerate(decoders):
+            start = time.perf_counter()
+            decode(body)
+            best[index] = min(best[index], time.perf_counter() - start)
+    return best
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    line_bytes = int(sys.argv[2]) if len(sys.argv) > 2 else 2048
+    body = build_body(lines, line_bytes)
+    names = ["old (json + json per line)", "LogDecoder (" + decoder.JSON_BACKEND + ")", "LogDecoder (json fallback)"]
+
+    timings = measure([old_decode, new_decode, fallback_decode], body)
+    print(f"{lines} lines of {line_bytes} bytes, body {len(body) / 2**20:.1f} MiB")
+    for name, elapsed in zip(names, timings):
+        print(f"{name:32} {lines / elapsed:>12,.0f} lines/s  {timings[0] / elapsed:>5.2f}x")
+
+if __name__ == "__main__":
+    main()
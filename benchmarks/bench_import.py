@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+# Measures the cold start of the CLI module with `python -X importtime` and fails when it goes over
+# the budget, or when a module only some subcommands need is imported up front.
+#
+#   python benchmarks/bench_import.py [budget_ms] [rounds]
+
+import os
+import sys
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# loaded by the subcommands that talk to loki or read a store, never by `import lokicli.lokicli`
+LAZY_MODULES = ["requests", "sqlite3", "gzip", "concurrent.futures", "lokicli.log_reader", "lokicli.transport", "lokicli.auth", "lokicli.log_store"]
+
+def measure():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import lokicli.lokicli"], cwd=ROOT, capture_output=True, text=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+def main():
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 150
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    # the first round warms the bytecode cache and the page cache
+    measure()
+    runs = [measure() for _ in range(rounds)]
+    best = min(runs, key=lambda modules: modules["lokicli.lokicli"])
+    total_ms = best["lokicli.lokicli"] / 1000
+
+    print(f"{'import lokicli.lokicli':32} {total_ms:>8.1f} ms (budget {budget_ms:.0f} ms)")
+    for name, cumulative in sorted(best.items(), key=lambda item: -item[1])[1:11]:
+        print(f"  {name:30} {cumulative / 1000:>8.1f} ms")
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if name in best]
+    if eager:
+        print(f"imported at startup: {', '.join(eager)}")
+        failed = True
+    if total_ms > budget_ms:
+        print(f"cold start of {total_ms:.1f} ms is over the budget of {budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
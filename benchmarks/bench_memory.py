@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Compares the memory held by a decoded pull at the 500000 line limit with the old per-line dicts
+# (timestamp kept as a string) and with LogRecord, and times merging context groups into one context
+# with the old list1 + list2 merge and with the linear merge_lists.
+#
+#   python benchmarks/bench_memory.py [lines] [merge_lines]
+
+import os
+import sys
+import json
+import time
+import heapq
+import tracemalloc
+from operator import itemgetter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lokicli.decoder import LogDecoder
+from lokicli.contextual_logs import ContextualLogs
+
+def build_body(lines, streams=4):
+    result = []
+    for stream in range(streams):
+        values = []
+        for i in range(lines // streams):
+            timestamp = str(1705881600000000000 - (i * streams + stream) * 1000)
+            values.append([timestamp, f"{timestamp} INFO GET /api/v1/orders/{i} 200 {i % 97}ms"])
+        result.append({"stream": {"app": "metro", "instance": "default", "namespace": "production", "pod": f"metro-{stream}"}, "values": values})
+    return json.dumps({"status": "success", "data": {"resultType": "streams", "result": result}}).encode()
+
+def _iter_old_stream(stream):
+    labels = stream["stream"]
+    for timestamp, line in stream["values"]:
+        yield timestamp, line, labels
+
+def old_decode(body):
+    # the previous decoder: streams merged on the timestamp strings, one dict per line
+    streams = [_iter_old_stream(stream) for stream in LogDecoder.loads(body)["data"]["result"]]
+    extract_log = LogDecoder.extract_log
+    return [{"log": extract_log(line), "timestamp": timestamp, "labels": labels} for timestamp, line, labels in heapq.merge(*streams, key=itemgetter(0), reverse=True)]
+
+def new_decode(body):
+    return list(LogDecoder.decode_response(body, "BACKWARD"))
+
+def measure_memory(decode, body, lines):
+    tracemalloc.start()
+    start = time.perf_counter()
+    logs = decode(body)
+    elapsed = time.perf_counter() - start
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del logs
+    return held, peak, elapsed
+
+def old_merge_lists(list1, list2):
+    merged_list = []
+    seen_lines = set()
+    for item in list1 + list2:
+        if (item["timestamp"], item["log"]) not in seen_lines:
+            merged_list.append(item)
+            seen_lines.add((item["timestamp"], item["log"]))
+    return merged_list
+
+def get_groups(logs, size=60, overlap=10):
+    # newest first groups that overlap the end of the previous one, as cut_context produces them
+    return [logs[start:start + size] for start in range(0, len(logs), size - overlap)]
+
+def measure_merge(merge, groups):
+    start = time.perf_counter()
+    context = list(groups[0])
+    for group in groups[1:]:
+        context = merge(context, group)
+    return len(context), time.perf_counter() - start
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    merge_lines = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    body = build_body(lines)
+    print(f"{lines} lines, body {len(body) / 2**20:.1f} MiB")
+
+    for name, decode in (("dict per line (old)", old_decode), ("LogRecord", new_decode)):
+        held, peak, elapsed = measure_memory(decode, body, lines)
+        print(f"{name:24} held {held / 2**20:>8.1f} MiB ({held / lines:>5.0f} B/line)  peak {peak / 2**20:>8.1f} MiB  {elapsed:>6.2f}s")
+
+    old_logs = old_decode(body)[:merge_lines]
+    new_logs = new_decode(body)[:merge_lines]
+    count, elapsed = measure_merge(old_merge_lists, get_groups(old_logs))
+    print(f"{'merge (list1 + list2)':24} {count} lines in {elapsed:>6.2f}s")
+    count, elapsed = measure_merge(ContextualLogs.merge_lists, get_groups(new_logs))
+    print(f"{'merge (linear)':24} {count} lines in {elapsed:>6.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# Measures how `logs -j N` scales against a fake loki that answers every page after a fixed latency,
+# checks that every -j returns the same lines as -j 1 and counts the lines fetched past the limit, and that
+# the result cache only aligns shards in the part of the window it can cache, without lowering -j.
+#
+#   python benchmarks/bench_parallel.py [limit] [batch_size] [latency_ms]
+
+import os
+import sys
+import time
+import threading
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lokicli.log_record import LogRecord
+from lokicli.result_cache import ResultCache
+from lokicli.parallel_fetcher import ParallelFetcher
+
+LABELS = {"app": "metro", "instance": "default", "namespace": "production"}
+
+class FakeLogReader:
+    # one line every step nanoseconds over the whole window, paged backwards like LogReader.iter_pages
+    def __init__(self, batch_size, latency, step=10**6):
+        self.batch_controller = SimpleNamespace(batch_size=batch_size)
+        self.result_cache = None
+        self.latency = latency
+        self.step = step
+        self.fetched = 0
+        self.lock = threading.Lock()
+
+    def iter_pages(self, start_time, end_time, limit, query):
+        timestamp = end_time - 1 - (end_time - 1) % self.step
+        while limit > 0 and timestamp >= start_time:
+            time.sleep(self.latency)
+            page = []
+            while len(page) < min(limit, self.batch_controller.batch_size) and timestamp >= start_time:
+                page.append(LogRecord(timestamp, f"{timestamp} INFO GET /api/v1/orders 200", LABELS))
+                timestamp -= self.step
+            with self.lock:
+                self.fetched += len(page)
+            limit = limit - len(page)
+            yield page
+
+def measure(parallelism, limit, batch_size, latency, span):
+    logReader = FakeLogReader(batch_size, latency)
+    start = time.perf_counter()
+    logs = [item for page in ParallelFetcher(logReader, parallelism).iter_pages(0, span, limit, "") for item in page]
+    return logs, time.perf_counter() - start, logReader.fetched
+
+def check_split_window(parallelism=8):
+    logReader = FakeLogReader(1000, 0)
+    logReader.result_cache = ResultCache("bench", 900, 600, 1)
+    fetcher = ParallelFetcher(logReader, parallelism)
+    now = time.time_ns()
+    closed_end = logReader.result_cache.get_closed_end(now)
+
+    # windows a day ago are all cacheable, those with fewer chunks than shards split chunks and are not aligned
+    hour, day = 3600 * 10**9, 24 * 3600 * 10**9
+    windows = [("last 10m", now - hour // 6, now, False), ("last 1h", now - hour, now, False), ("15m a day ago", now - day - hour // 4, now - day, False),
+               ("30m a day ago", now - day - hour // 2, now - day, False), ("1h a day ago", now - day - hour, now - day, False), ("6h a day ago", now - day - 6 * hour, now - day, True)]
+    for name, start_time, end_time, aligned in windows:
+        shards = fetcher.split_window(start_time, end_time)
+        boundaries = [shard_start for shard_start, _ in shards[:-1]]
+        unaligned = [boundary for boundary in boundaries if boundary < closed_end and boundary != logReader.result_cache.align(boundary)]
+        print(f"-j {parallelism} over {name:14} {len(shards)} shards")
+        if aligned and unaligned:
+            raise SystemExit(f"{name}: shard boundaries inside the cacheable part are not on chunk boundaries")
+        if len(shards) != parallelism:
+            raise SystemExit(f"{name}: got {len(shards)} shards instead of {parallelism}")
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.05
+    # the window holds exactly the limit, so every shard has lines that get printed
+    span = limit * 10**6
+
+    expected, elapsed, _ = measure(1, limit, batch_size, latency, span)
+    baseline = len(expected) / elapsed
+    print(f"{limit} lines, pages of {batch_size}, {latency * 1000:.0f} ms per page")
+    for parallelism in (1, 2, 4, 8):
+        logs, elapsed, fetched = measure(parallelism, limit, batch_size, latency, span)
+        if [item.timestamp for item in logs] != [item.timestamp for item in expected]:
+            raise SystemExit(f"-j {parallelism} returned different lines than -j 1")
+        print(f"-j {parallelism:<3} {len(logs) / elapsed:>10,.0f} lines/s  {len(logs) / elapsed / baseline:>5.1f}x  fetched {fetched / limit:>4.2f}x the limit")
+
+    # a fetcher iterated a second time, eg after the first run was abandoned, returns every line again
+    fetcher = ParallelFetcher(FakeLogReader(batch_size, 0), 4)
+    next(fetcher.iter_pages(0, span, limit, "")).clear()
+    if sum(len(page) for page in fetcher.iter_pages(0, span, limit, "")) != limit:
+        raise SystemExit("a second iter_pages on the same fetcher stopped early")
+
+    # a window with many more lines than the limit, only the newest shards should be fetched
+    _, _, fetched = measure(8, limit, batch_size, latency, span * 20)
+    print(f"-j 8 over {20 * limit} lines fetched {fetched / limit:.2f}x the limit")
+
+    # a limit of many pages per shard, the lines fetched ahead stay within the read-ahead of every shard
+    small_pages = max(1, batch_size // 10)
+    _, _, fetched = measure(8, limit, small_pages, 0, span * 20)
+    read_ahead = 7 * (ParallelFetcher.PREFETCH_PAGES + 1) * small_pages
+    print(f"-j 8 with pages of {small_pages} fetched {fetched - limit} lines past the limit (read-ahead {read_ahead})")
+    if fetched - limit > read_ahead:
+        raise SystemExit("older shards fetched more than their read-ahead")
+
+    check_split_window()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+from .log_record import LogRecord
+from .errors import LokiError, AuthenticationError, InvalidArgumentError, TransportError, AppNotFoundError, QueryError, QueryLimitError, QueryTimeoutError, PageLimitError
+
+__all__ = ["LokiClient", "LogRecord", "LokiError", "AuthenticationError", "InvalidArgumentError", "TransportError", "AppNotFoundError", "QueryError", "QueryLimitError", "QueryTimeoutError", "PageLimitError"]
+
+def __getattr__(name):
+    # the client pulls in requests, so the cli only loads it once a subcommand needs it
+    if name == "LokiClient":
+        from .client import LokiClient
+        return LokiClient
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
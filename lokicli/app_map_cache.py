@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import logging
+import tempfile
+
+from .config import LokiConfig
+from .time_utils import LokiTimeUtils
+
+RETENTION_SECONDS = 720 * 3600
+
+class AppMapCache:
+    def __init__(self, project, ttl):
+        self.project = project
+        self.ttl = ttl
+        self.CACHE_FILE = LokiConfig.get_file_path(f'appmap-{project}.json')
+        self.covered_from = ""
+        self.covered_to = ""
+        self.apps = {}
+
+    @staticmethod
+    def _seconds(utc_timestamp):
+        return LokiTimeUtils.utc_to_unix_nanosecond_epoch(utc_timestamp) // 10**9
+
+    def load(self):
+        try:
+            if os.path.exists(self.CACHE_FILE):
+                with open(self.CACHE_FILE, "r") as file:
+                    cache = json.load(file)
+                self.covered_from = cache["covered_from"]
+                self.covered_to = cache["covered_to"]
+                self.apps = cache["apps"]
+        except Exception as e:
+            # a corrupt cache is rebuilt from loki on the next refresh
+            logging.error(f"Error loading app map cache for project {self.project}: {e}")
+            self.covered_from, self.covered_to, self.apps = "", "", {}
+        return self
+
+    def save(self):
+        try:
+            cache = {"covered_from": self.covered_from, "covered_to": self.covered_to, "apps": self.apps}
+            cache_dir = os.path.dirname(self.CACHE_FILE)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".appmap-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as file:
+                    json.dump(cache, file)
+                os.replace(tmp_path, self.CACHE_FILE)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            logging.error(f"Error saving app map cache for project {self.project}: {e}")
+            raise e
+
+    def is_reusable(self, from_time, to_time, strict=False):
+        if not self.covered_to or to_time < self.covered_from or from_time > self.covered_to:
+            return False
+
+        # listing apps must not include apps that only logged long before from_time
+        if strict and self._seconds(from_time) - self._seconds(self.covered_from) > self.ttl:
+            return False
+        return True
+
+    def get_missing_windows(self, from_time, to_time, force_refresh=False):
+        ttl = 0 if force_refresh else self.ttl
+        if not self.covered_to:
+            return [(from_time, to_time)]
+
+        missing_windows = []
+        if from_time < self.covered_from:
+            missing_windows.append((from_time, self.covered_from))
+        if self._seconds(to_time) - self._seconds(self.covered_to) > ttl:
+            missing_windows.append((self.covered_to, to_time))
+        return missing_windows
+
+    def update(self, app_map, from_time, to_time):
+        if not self.covered_to:
+            self.covered_from, self.covered_to = from_time, to_time
+        else:
+            self.covered_from = min(self.covered_from, from_time)
+            self.covered_to = max(self.covered_to, to_time)
+
+        for app_name, labels in app_map.items():
+            entry = self.apps.get(app_name)
+            if entry:
+                entry["labels"] = labels
+                entry["first_seen"] = min(entry["first_seen"], from_time)
+                entry["last_seen"] = max(entry["last_seen"], to_time)
+            else:
+                self.apps[app_name] = {"labels": labels, "first_seen": from_time, "last_seen": to_time}
+
+        oldest = self._seconds(self.covered_to) - RETENTION_SECONDS
+        self.apps = {name: entry for name, entry in self.apps.items() if self._seconds(entry["last_seen"]) >= oldest}
+
+    def reset(self):
+        self.covered_from, self.covered_to, self.apps = "", "", {}
+
+    def get_app_map(self, from_time, to_time):
+        return {name: entry["labels"] for name, entry in self.apps.items() if entry["first_seen"] <= to_time and entry["last_seen"] >= from_time}
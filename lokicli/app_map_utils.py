@@ -1,46 +1,153 @@
 #!usr/bin/env python3
 
 from datetime import datetime, timezone
-import requests
+import re
+import time
+import fnmatch
 import logging
-from .auth import Auth
+
+from .config import LokiConfig
+from .app_map_cache import AppMapCache
+from .errors import QueryError
+
+NAMESPACE_ALIASES = {"prod": ["production", "prod"], "stage": ["staging", "stage"]}
 
 class AppMapUtils:
-    def __init__(self, url, project):
+    # label sets resolved by this process, a long running `lokicli serve` reuses them for cacheTtl seconds
+    _resolved = {}
+
+    def __init__(self, url, project, transport):
         self.url = url
         self.project = project
+        self.transport = transport
         self.app_map = {}
 
+        try:
+            properties = LokiConfig().get_properties()
+            self.cache_ttl = int(properties['appMap']['cacheTtl'])
+        except Exception as e:
+            logging.error(f"Error getting app map cache ttl: {e}")
+            raise e
+
+    @staticmethod
+    def get_app_name(label):
+        namespace = label['namespace']
+        app_name = f"{label['app']}-{label['instance']}-"
+        app_name += 'prod' if namespace == 'production' else 'stage' if namespace == 'staging' else namespace
+        return app_name
+
     def _populate_app_map(self, labels):
         try:
             for label in labels:
                 if 'app' in label and 'instance' in label and 'namespace' in label:
-                    namespace = label['namespace']
-                    new_label = f"{label['app']}-{label['instance']}-"
-                    new_label += 'prod' if namespace == 'production' else 'stage' if namespace == 'staging' else namespace
-                    self.app_map[new_label] = label
+                    self.app_map[self.get_app_name(label)] = label
         except Exception as e:
             logging.error(f"Error populating app map: {e}")
             raise e
 
-    def get_app_map(self, from_time, to_time, access_token):
+    @staticmethod
+    def get_label_candidates(app_name):
+        # app names follow "<app>-<instance>-<namespace>" and each part may contain hyphens itself
+        parts = app_name.split("-")
+        candidates = set()
+        for i in range(1, len(parts) - 1):
+            for j in range(i + 1, len(parts)):
+                app, instance, namespace = "-".join(parts[:i]), "-".join(parts[i:j]), "-".join(parts[j:])
+                for alias in NAMESPACE_ALIASES.get(namespace, [namespace]):
+                    candidates.add((app, instance, alias))
+        return candidates
+
+    def get_app_selector(self, app_name):
+        candidates = self.get_label_candidates(app_name)
+        if not candidates:
+            return ""
+
+        matchers = []
+        for label, values in zip(["app", "instance", "namespace"], zip(*candidates)):
+            matchers.append(f'{label}=~`{"|".join(re.escape(value) for value in sorted(set(values)))}`')
+        return "{" + ",".join(matchers) + "}"
+
+    def resolve_app(self, app_name, from_time, to_time):
+        resolved = AppMapUtils._resolved.get((self.project, app_name))
+        if resolved and time.monotonic() - resolved[1] < self.cache_ttl:
+            return resolved[0]
+
+        labels = self._resolve_app(app_name, from_time, to_time)
+        if labels:
+            AppMapUtils._resolved[(self.project, app_name)] = (labels, time.monotonic())
+        return labels
+
+    def _resolve_app(self, app_name, from_time, to_time):
+        try:
+            if self.cache_ttl > 0:
+                cache = AppMapCache(self.project, self.cache_ttl).load()
+                if cache.is_reusable(from_time, to_time) and not cache.get_missing_windows(from_time, to_time):
+                    labels = cache.get_app_map(from_time, to_time).get(app_name)
+                    if labels:
+                        return labels
+
+            selector = self.get_app_selector(app_name)
+            if selector:
+                labels = [label for label in self.get_series(from_time, to_time, selector) if self.get_app_name(label) == app_name]
+                matches = {(label["app"], label["instance"], label["namespace"]) for label in labels}
+                if len(matches) == 1:
+                    return labels[-1]
+                if len(matches) > 1:
+                    logging.warning(f"App name {app_name} matches several label sets {matches}, enumerating all series.")
+
+            self.app_map = {}
+            return self.get_cached_app_map(from_time, to_time, force_refresh=True).get(app_name)
+        except Exception as e:
+            logging.error(f"Error resolving app {app_name}: {e}")
+            raise e
+
+    @staticmethod
+    def is_pattern(app_name):
+        return any(char in app_name for char in "*?[")
+
+    def resolve_apps(self, app_names, from_time, to_time):
+        resolved = {}
+        for app_name in app_names:
+            if self.is_pattern(app_name):
+                app_map = self.get_cached_app_map(from_time, to_time)
+                resolved.update((name, labels) for name, labels in app_map.items() if fnmatch.fnmatchcase(name, app_name))
+                continue
+
+            labels = self.resolve_app(app_name, from_time, to_time)
+            if labels:
+                resolved[app_name] = labels
+        return resolved
+
+    @staticmethod
+    def get_group_selectors(labels_list):
+        # apps sharing a namespace and instance are read by one selector, so loki scans their streams once
+        groups = {}
+        for labels in labels_list:
+            groups.setdefault((labels["namespace"], labels["instance"]), set()).add(labels["app"])
+
+        selectors = []
+        for (namespace, instance), apps in sorted(groups.items()):
+            apps = sorted(apps)
+            app_matcher = f'app="{apps[0]}"' if len(apps) == 1 else f'app=~`{"|".join(re.escape(app) for app in apps)}`'
+            selectors.append(f'{{{app_matcher},namespace="{namespace}",instance="{instance}"}}')
+        return selectors
+
+    def get_series(self, from_time, to_time, selector="{}"):
         params = {
             "end": to_time,
-            "match": "{}",
+            "match": selector,
             "start": from_time,
         }
 
         try:
-            cookies = {"_oauth2_proxy": access_token}
-            response = requests.get(f"{self.url}/loki/api/v1/series", cookies=cookies, params=params, timeout=60)
+            response = self.transport.get_api(f"{self.url}/loki/api/v1/series", params=params, timeout=60)
             if response.status_code == 400:
                logging.error("Selected time range is out of range. Valid time range is within last 720 hours.")
-               raise Exception("Selected time range is out of range. Valid time range is within last 720 hours.")
+               raise QueryError("Selected time range is out of range. Valid time range is within last 720 hours.")
             if response.status_code != 200:
                 logging.error(f"Error getting app map: {response.status_code}, {response.text}")
-                raise Exception(f"Error getting app map: {response.status_code}, {response.text}")
-            labels = response.json()["data"]
-            self._populate_app_map(labels)
+                raise QueryError(f"Error getting app map: {response.status_code}, {response.text}")
+            return response.json()["data"]
         except KeyboardInterrupt:
             logging.error("Interrupted by user.")
             raise KeyboardInterrupt
@@ -48,4 +155,32 @@ class AppMapUtils:
             logging.error(f"Error getting app map: {e}")
             raise e
 
+    def get_app_map(self, from_time, to_time):
+        self._populate_app_map(self.get_series(from_time, to_time))
+        return self.app_map
+
+    def get_cached_app_map(self, from_time, to_time, strict=False, force_refresh=False):
+        if self.cache_ttl <= 0:
+            return self.get_app_map(from_time, to_time)
+
+        try:
+            cache = AppMapCache(self.project, self.cache_ttl).load()
+            if not cache.is_reusable(from_time, to_time, strict):
+                cache.reset()
+
+            missing_windows = cache.get_missing_windows(from_time, to_time, force_refresh)
+            for window_from, window_to in missing_windows:
+                self.app_map = {}
+                cache.update(self.get_app_map(window_from, window_to), window_from, window_to)
+
+            if missing_windows:
+                cache.save()
+            self.app_map = cache.get_app_map(from_time, to_time)
+        except KeyboardInterrupt:
+            logging.error("Interrupted by user.")
+            raise KeyboardInterrupt
+        except Exception as e:
+            logging.error(f"Error getting cached app map: {e}")
+            raise e
+
         return self.app_map
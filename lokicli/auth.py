@@ -1,51 +1,92 @@
 #!usr/bin/env python3
 
-import requests
-import logging
 import os
+import json
+import time
+import logging
+import tempfile
 
 from .config import LokiConfig
 
 class Auth:
-    def __init__(self, url):
+    # a cookie this close to its expiry is probed again even inside the verified window
+    EXPIRY_MARGIN_SECONDS = 60
+
+    def __init__(self, url, transport):
         self.url = url
-        self.AUTH_FILE = LokiConfig().get_file_path('lokicli.auth')
+        self.transport = transport
+        self.AUTH_FILE = LokiConfig().get_file_path('auth.json')
+        self.LEGACY_AUTH_FILE = LokiConfig().get_file_path('lokicli.auth')
+        self.expires_at = None
 
-    def save_access_token(self, project, cookie):
-        flag=0
-        
         try:
-            with open(self.AUTH_FILE, "a") as file:
-                pass
+            properties = LokiConfig().get_properties()['auth']
+            self.verified_ttl = int(properties['verifiedTtlSeconds'])
+        except Exception as e:
+            logging.error(f"Error getting auth properties: {e}")
+            raise e
 
+    def _load(self):
+        # {"projects": {project: {"token": ..., "verified_at": ..., "expires_at": ...}}}
+        if os.path.exists(self.AUTH_FILE):
             with open(self.AUTH_FILE, "r") as file:
-                file_content = file.read().strip()
-                for line in file_content.splitlines():
-                    if line.startswith(project):
-                        file_content = file_content.replace(line, project + ":" + cookie)
-                        flag=1
-                        break
-            
-            if flag==1:
-                with open(self.AUTH_FILE, "w") as file:
-                    file.write(file_content)
-            else:
-                with open(self.AUTH_FILE, "a") as file:
-                    file.write("\n" + project + ":" + cookie)
+                return json.load(file)
+
+        projects = {}
+        if os.path.exists(self.LEGACY_AUTH_FILE):
+            # lokicli.auth has a project:token line per project, those tokens are probed once before they are used
+            with open(self.LEGACY_AUTH_FILE, "r") as file:
+                for line in file.read().splitlines():
+                    project, _, token = line.strip().partition(":")
+                    if project and token:
+                        projects[project] = {"token": token, "verified_at": 0, "expires_at": None}
+        return {"projects": projects}
+
+    def _save(self, auth):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.AUTH_FILE), prefix=".auth-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(auth, file, indent=2)
+            os.replace(tmp_path, self.AUTH_FILE)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        if os.path.exists(self.LEGACY_AUTH_FILE):
+            os.remove(self.LEGACY_AUTH_FILE)
+
+    def save_access_token(self, project, cookie):
+        try:
+            auth = self._load()
+            saved = auth["projects"].get(project, {})
+            # the expiry is only known right after a login, so it is kept for as long as the cookie is the same
+            expires_at = saved.get("expires_at") if saved.get("token") == cookie else self.expires_at
+            auth["projects"][project] = {"token": cookie, "verified_at": time.time(), "expires_at": expires_at}
+            self._save(auth)
         except Exception as e:
             logging.error(f"Error saving cookie for project {project}: {e}")
             raise e
 
     def get_saved_access_token(self, project):
         try:
-            if os.path.exists(self.AUTH_FILE):
-                with open(self.AUTH_FILE, "r") as file:
-                    file_content = file.read().strip()
-                    for line in file_content.splitlines():
-                        if line.startswith(project):
-                            return line.split(":")[1]
-            else:
+            return self._load()["projects"].get(project, {}).get("token", "")
+        except Exception as e:
+            logging.error(f"Error loading cookie for project {project}: {e}")
+            raise e
+
+    def get_verified_access_token(self, project):
+        # a cookie the gateway accepted less than verifiedTtlSeconds ago is used without probing it again
+        try:
+            saved = self._load()["projects"].get(project)
+            if not saved:
                 return ""
+
+            now = time.time()
+            if now - saved["verified_at"] >= self.verified_ttl:
+                return ""
+            if saved["expires_at"] and saved["expires_at"] - now < self.EXPIRY_MARGIN_SECONDS:
+                return ""
+            return saved["token"]
         except Exception as e:
             logging.error(f"Error loading cookie for project {project}: {e}")
             raise e
@@ -65,14 +106,22 @@ class Auth:
         response_header = self.get_response_header(response, "_oauth2_proxy_csrf")
         return response_header.split(",")[2].split(";")[0][15:] if response_header else ""
 
+    @staticmethod
+    def get_access_token_expiry(response):
+        for cookie in response.cookies:
+            if cookie.name == "_oauth2_proxy":
+                return cookie.expires
+        return None
+
     def exchange_tokens(self, csrf_token, callback_url):
         try:
             cookies = {"_oauth2_proxy_csrf": csrf_token}
-            response = requests.get(callback_url, cookies=cookies, allow_redirects=False)
+            response = self.transport.get(callback_url, cookies=cookies, allow_redirects=False)
 
             if response.status_code == 302:
                 access_token = self.get_access_token(response)
                 if access_token:
+                    self.expires_at = self.get_access_token_expiry(response)
                     return access_token
                 else:
                     raise Exception("Failed to retrieve access token cookie.")
@@ -84,11 +133,12 @@ class Auth:
 
     def get_new_access_token(self):
         try:
-            response = requests.get(self.url, allow_redirects=False)
+            self.transport.clear_access_token(self.url)
+            response = self.transport.get(self.url, allow_redirects=False)
 
             if response.status_code == 302:
                 auth_start_url = self.get_response_header(response, "https")
-                response = requests.get(auth_start_url, allow_redirects=False)
+                response = self.transport.get(auth_start_url, allow_redirects=False)
 
                 if response.status_code == 302:
                     csrf_token = self.get_csrf_token(response)
@@ -114,15 +164,11 @@ class Auth:
 
     def delete_access_token(self, project):
         try:
-            with open(self.AUTH_FILE, "r") as file:
-                file_content = file.read().strip()
-                for line in file_content.splitlines():
-                    if line.startswith(project):
-                        file_content = file_content.replace(line, "".strip())
-                        break
-
-            with open(self.AUTH_FILE, "w") as file:
-                file.write(file_content)
+            auth = self._load()
+            if auth["projects"].pop(project, None):
+                self._save(auth)
+
+            self.transport.clear_access_token(self.url)
         except Exception as e:
             logging.error(f"Error deleting cookie for project {project}: {e}")
             raise e
@@ -130,7 +176,7 @@ class Auth:
     def get_auth_status(self, project, access_token):
         try:
             cookies = {"_oauth2_proxy": access_token}
-            loki_response = requests.get(self.url, cookies=cookies, allow_redirects=False)
+            loki_response = self.transport.get(self.url, cookies=cookies, allow_redirects=False)
             
             if loki_response.status_code == 200:
                 self.save_access_token(project, access_token)
@@ -141,3 +187,16 @@ class Auth:
         except Exception as e:
             logging.error(f"Error checking auth status: {e}")
             raise e
+
+    def reauthenticate(self, project):
+        # called by the transport when the gateway answers an api call with 401 or 302
+        try:
+            self.delete_access_token(project)
+            print(f"Session for {project} expired, logging in again...")
+            access_token = self.get_new_access_token()
+            if not self.get_auth_status(project, access_token):
+                raise Exception(f"Login failed for project {project}. Please run lokicli login -p {project}.")
+            return access_token
+        except Exception as e:
+            logging.error(f"Error logging into {project} again: {e}")
+            raise e
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import logging
+import tempfile
+import threading
+
+from .config import LokiConfig
+
+class BatchSizeController:
+    def __init__(self, key, batch_size, max_batch_size, target_latency, target_bytes, adaptive=True):
+        self.BATCH_SIZE_FILE = LokiConfig.get_file_path('batchsizes.json')
+        self.key = key
+        self.min_batch_size = min(batch_size, 50)
+        self.max_batch_size = max_batch_size
+        self.target_latency = target_latency
+        self.target_bytes = target_bytes
+        self.adaptive = adaptive
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+
+        if adaptive:
+            saved = self._load().get(key, {})
+            self.max_batch_size = min(self.max_batch_size, saved.get("max_batch_size", self.max_batch_size))
+            self.batch_size = min(saved.get("batch_size", batch_size), self.max_batch_size)
+
+    def _load(self):
+        try:
+            if os.path.exists(self.BATCH_SIZE_FILE):
+                with open(self.BATCH_SIZE_FILE, "r") as file:
+                    return json.load(file)
+        except Exception as e:
+            logging.error(f"Error loading batch sizes: {e}")
+        return {}
+
+    def save(self):
+        if not self.adaptive:
+            return
+
+        try:
+            batch_sizes = self._load()
+            batch_sizes[self.key] = {"batch_size": self.batch_size, "max_batch_size": self.max_batch_size}
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.BATCH_SIZE_FILE), prefix=".batchsizes-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as file:
+                    json.dump(batch_sizes, file)
+                os.replace(tmp_path, self.BATCH_SIZE_FILE)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except Exception as e:
+            # losing the learned size only costs a slower start next time
+            logging.error(f"Error saving batch sizes: {e}")
+
+    def record(self, elapsed, content_length, lines, page_limit):
+        # pages cut short by the remaining limit are dominated by the fixed per-request overhead
+        if not self.adaptive or not lines or page_limit < self.batch_size:
+            return
+
+        with self.lock:
+            by_latency = page_limit * self.target_latency / max(elapsed, 0.001)
+            by_bytes = self.target_bytes * lines / max(content_length, 1)
+            target = int(min(by_latency, by_bytes))
+
+            if target < self.batch_size:
+                self.batch_size = max(self.min_batch_size, target)
+            elif lines >= page_limit:
+                # only full pages show how the server copes with the current size, grow at most 2x per page
+                self.batch_size = min(self.max_batch_size, target, self.batch_size * 2)
+
+    def record_failure(self):
+        if not self.adaptive:
+            return
+
+        with self.lock:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            logging.info(f"Reduced batch size for {self.key} to {self.batch_size}")
+
+    def learn_max_batch_size(self, error_text):
+        # eg: max entries limit per query exceeded, limit > max_entries_limit (5001 > 5000)
+        match = re.search(r"max_entries_limit \((\d+) > (\d+)\)", error_text)
+        if not match:
+            return False
+
+        with self.lock:
+            self.max_batch_size = int(match.group(2))
+            self.batch_size = min(self.batch_size, self.max_batch_size)
+            logging.info(f"Server max entries limit for {self.key} is {self.max_batch_size}")
+        return True
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+
+from .config import LokiConfig
+from .auth import Auth
+from .transport import LokiTransport
+from .log_reader import LogReader
+from .parallel_fetcher import ParallelFetcher
+from .app_map_utils import AppMapUtils
+from .time_utils import LokiTimeUtils
+from .errors import LokiError, AuthenticationError
+
+class LokiClient:
+    def __init__(self, project=None, transport=None, parallel=1, no_cache=False):
+        config = LokiConfig()
+        self.project = project or config.load_project()
+        self.parallel = parallel
+        self.no_cache = no_cache
+
+        try:
+            properties = config.get_properties()
+            valid_projects = properties['validProjects']['projects'].split(", ")
+            self.default_limit = int(properties['logReader']['defaultLimit'])
+        except Exception as e:
+            logging.error(f"Error getting Loki properties file: {e}")
+            raise e
+
+        if self.project not in valid_projects:
+            logging.error(f"Invalid project: {self.project}")
+            raise LokiError(f"Invalid project: {self.project}")
+
+        self.url = self.get_url(self.project)
+        self.owns_transport = transport is None
+        self.transport = transport or LokiTransport()
+        self.auth = Auth(self.url, self.transport)
+        self.logged_in = False
+
+    @staticmethod
+    def get_url(project):
+        return f"https://loki-gateway.{project}.{LokiConfig().get_properties()['urlSuffix']}"
+
+    def login(self, verify=False):
+        # uses the login saved by `lokicli login`, only the cli asks the user for a new one
+        access_token = "" if verify else self.auth.get_verified_access_token(self.project)
+        if not access_token:
+            access_token = self.auth.get_saved_access_token(self.project)
+            if not access_token or not self.auth.get_auth_status(self.project, access_token):
+                logging.error(f"Not logged into {self.project}.")
+                raise AuthenticationError(f"Not logged into {self.project}. Please run lokicli login -p {self.project}.")
+
+        self.transport.set_access_token(self.url, access_token)
+        self.logged_in = True
+
+    def get_log_reader(self, no_cache=None):
+        if not self.logged_in:
+            self.login()
+
+        logReader = LogReader(self.project, self.url, self.transport)
+        if self.no_cache if no_cache is None else no_cache:
+            logReader.result_cache = None
+        return logReader
+
+    def iter_pages(self, app_name, limit=None, from_time=None, to_time=None, since="1h", query=None, invert_match=False, pipeline=None):
+        # pages of LogRecords, newest first, fetched as they are consumed
+        queries = [query] if isinstance(query, str) else query
+        logReader = self.get_log_reader()
+        # checks the parallelism before loki is asked to resolve the app
+        fetcher = ParallelFetcher(logReader, self.parallel)
+        start_time, end_time, limit, query = logReader.get_processed_params(app_name, limit or self.default_limit, from_time, to_time, since, queries, invert_match, 0, pipeline)
+        try:
+            yield from fetcher.iter_pages(start_time, end_time, limit, query)
+        finally:
+            logReader.batch_controller.save()
+
+    def iter_logs(self, app_name, limit=None, from_time=None, to_time=None, since="1h", query=None, invert_match=False, pipeline=None):
+        for logs in self.iter_pages(app_name, limit, from_time, to_time, since, query, invert_match, pipeline):
+            yield from logs
+
+    def list_apps(self, from_time=None, to_time=None, since="1h"):
+        if not self.logged_in:
+            self.login()
+
+        from_time, to_time = LokiTimeUtils().get_from_and_to_times(from_time, to_time, since)
+        return sorted(AppMapUtils(self.url, self.project, self.transport).get_cached_app_map(from_time, to_time, strict=True))
+
+    async def aiter_logs(self, app_name, limit=None, from_time=None, to_time=None, since="1h", query=None, invert_match=False, pipeline=None):
+        # every page is fetched on a worker thread, so the event loop keeps running while loki answers
+        loop = asyncio.get_running_loop()
+        pages = self.iter_pages(app_name, limit, from_time, to_time, since, query, invert_match, pipeline)
+        try:
+            while True:
+                logs = await loop.run_in_executor(None, next, pages, None)
+                if logs is None:
+                    return
+                for item in logs:
+                    yield item
+        finally:
+            await loop.run_in_executor(None, pages.close)
+
+    async def alist_apps(self, from_time=None, to_time=None, since="1h"):
+        return await asyncio.get_running_loop().run_in_executor(None, self.list_apps, from_time, to_time, since)
+
+    def close(self):
+        if self.owns_transport:
+            self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
@@ -3,35 +3,97 @@
 import os
 import logging
 import configparser
+from types import MappingProxyType
+from collections.abc import Mapping
+
+class PropertiesSection(Mapping):
+    # read-only view of a properties section, option names are case-insensitive like in configparser
+    def __init__(self, options):
+        self._options = {name.lower(): value for name, value in options.items()}
+
+    def __getitem__(self, name):
+        return self._options[name.lower()]
+
+    def __iter__(self):
+        return iter(self._options)
+
+    def __len__(self):
+        return len(self._options)
 
 class LokiConfig:
+    _properties = None
+
     def __init__(self):
         self.CONFIG_FILE = self.get_file_path('lokicli.conf')
 
     def get_properties(self):
+        # read once per process, every module asks for the properties when it is created
+        if LokiConfig._properties is not None:
+            return LokiConfig._properties
+
         try:
             self.write_properties_file()
+            properties = self.get_default_properties()
             with open(self.get_file_path('properties.ini'), 'r') as f:
-                properties = configparser.ConfigParser()
                 properties.read_file(f)
-                return properties
+            LokiConfig._properties = MappingProxyType({section: PropertiesSection(properties[section]) for section in properties.sections()})
+            return LokiConfig._properties
         except Exception as e:
             logging.error(f"Error getting Loki properties file: {e}")
             raise e
 
+    @staticmethod
+    def get_default_properties():
+        config = configparser.ConfigParser()
+        config.add_section('logReader')
+        config.set('logReader', 'batchSize', '250')
+        config.set('logReader', 'defaultLimit', '1000')
+        config.set('logReader', 'parallelism', '1')
+        config.set('logReader', 'maxBatchSize', '5000')
+        config.set('logReader', 'adaptiveBatchSize', 'true')
+        config.set('logReader', 'targetLatencySeconds', '2')
+        config.set('logReader', 'targetPageBytes', '4194304')
+
+        config.add_section('appMap')
+        config.set('appMap', 'cacheTtl', '300')
+
+        config.add_section('requestPolicy')
+        config.set('requestPolicy', 'maxRetries', '5')
+        config.set('requestPolicy', 'baseDelaySeconds', '0.5')
+        config.set('requestPolicy', 'maxDelaySeconds', '30')
+        config.set('requestPolicy', 'requestsPerSecond', '20')
+        config.set('requestPolicy', 'burst', '40')
+        config.set('requestPolicy', 'maxInFlight', '16')
+
+        config.add_section('resultCache')
+        config.set('resultCache', 'enabled', 'true')
+        config.set('resultCache', 'chunkSeconds', '900')
+        config.set('resultCache', 'closedAfterSeconds', '600')
+        config.set('resultCache', 'maxSizeMb', '1024')
+
+        config.add_section('auth')
+        config.set('auth', 'verifiedTtlSeconds', '900')
+
+        config.add_section('daemon')
+        config.set('daemon', 'idleTimeoutSeconds', '1800')
+
+        config.add_section('contextualLogs')
+        config.set('contextualLogs', 'clusterGapSeconds', '5')
+        config.set('contextualLogs', 'clusterMaxLines', '5000')
+
+        config.add_section('validProjects')
+        config.set('validProjects', 'projects', 's2s, ao3, s2s-use1')
+        return config
+
     def write_properties_file(self):
+        # options missing from an older file fall back to the defaults, so the file is only written when missing
         try:
             propertiesFilePath = self.get_file_path('properties.ini')
-            config = configparser.ConfigParser()
-            config.add_section('logReader')
-            config.set('logReader', 'batchSize', '250')
-            config.set('logReader', 'defaultLimit', '1000')
-
-            config.add_section('validProjects')
-            config.set('validProjects', 'projects', 's2s, ao3, s2s-use1')
+            if os.path.exists(propertiesFilePath):
+                return
 
             with open(propertiesFilePath, 'w') as f:
-                config.write(f)
+                self.get_default_properties().write(f)
         except Exception as e:
             logging.error(f"Error writing Loki properties file: {e}")
             raise e
@@ -1,48 +1,141 @@
 #!usr/bin/env python3
 
-import re
-import colorama
 import logging
 
+from .config import LokiConfig
+from .highlighter import Highlighter
+
 class ContextualLogs:
-    def __init__(self):
-        pass
+    def __init__(self, sink=None, source_width=0):
+        self.sink = sink
+        self.source_width = source_width
+
+        try:
+            properties = LokiConfig().get_properties()
+            self.cluster_gap = int(float(properties['contextualLogs']['clusterGapSeconds']) * 10**9)
+            self.cluster_max_lines = int(properties['contextualLogs']['clusterMaxLines'])
+        except Exception as e:
+            logging.error(f"Error getting context clustering properties: {e}")
+            raise e
 
     @staticmethod
-    def get_contextual_logs(logReader, app_name, context, from_time, to_time, since, access_token, item, direction):
+    def get_contextual_logs(logReader, query, timestamp, context, direction):
         try:
-            start_time, end_time, limit, query = logReader.get_processed_params(app_name, context, from_time, to_time, since, "", False, access_token, 0)
             time_range = 100000000000000
 
             params = {
                     "direction": direction,
-                    "end": str(int(item["timestamp"]) + time_range) if direction == "FORWARD" else item["timestamp"],
-                    "limit": context+1 if direction == "FORWARD" else context,
+                    "end": str(timestamp + time_range) if direction == "FORWARD" else str(timestamp),
+                    "limit": context,
                     "query": query,
-                    "start": item["timestamp"] if direction == "FORWARD" else str(int(item["timestamp"]) - time_range),
+                    "start": str(timestamp + 1) if direction == "FORWARD" else str(timestamp - time_range),
                 }
 
-            return logReader.fetch_logs(params, access_token)
+            return logReader.fetch_logs(params)
         except Exception as e:
-            logging.error(f"Error getting forward contextual logs: {e}")
+            logging.error(f"Error getting {direction.lower()} contextual logs: {e}")
             raise e
 
     @staticmethod
     def merge_lists(list1, list2):
+        # both lists are newest first and list2 starts inside or after the end of list1, so only the tail of
+        # list1 that overlaps list2 is merged, in a single pass, and list1 is extended in place
         try:
-            merged_list = []
-            seen_timestamps = set()
+            if not list2:
+                return list1
+
+            start = len(list1)
+            while start > 0 and list1[start - 1].timestamp <= list2[0].timestamp:
+                start -= 1
+            tail = list1[start:]
+            del list1[start:]
+
+            i, j = 0, 0
+            seen_lines, seen_timestamp = set(), None
+            while i < len(tail) or j < len(list2):
+                if j == len(list2) or (i < len(tail) and tail[i].timestamp >= list2[j].timestamp):
+                    item, i = tail[i], i + 1
+                else:
+                    item, j = list2[j], j + 1
 
-            for item in list1 + list2:
-                if item["timestamp"] not in seen_timestamps:
-                    merged_list.append(item)
-                    seen_timestamps.add(item["timestamp"])
+                # equal lines can only repeat within one timestamp
+                if item.timestamp != seen_timestamp:
+                    seen_lines, seen_timestamp = set(), item.timestamp
+                if item.line not in seen_lines:
+                    seen_lines.add(item.line)
+                    list1.append(item)
 
-            return merged_list
+            return list1
         except Exception as e:
             logging.error(f"Error merging lists: {e}")
             raise e
 
+    def get_match_clusters(self, logs):
+        # a cluster is only yielded once the next match is too far from it, so it can span pages
+        cluster = []
+        for item in logs:
+            if cluster and cluster[-1].timestamp - item.timestamp > self.cluster_gap:
+                yield cluster
+                cluster = []
+            cluster.append(item)
+        if cluster:
+            yield cluster
+
+    def get_cluster_lines(self, logReader, query, cluster, older_context, newer_context):
+        newest, oldest = cluster[0].timestamp, cluster[-1].timestamp
+
+        window = []
+        for page in logReader.iter_pages(oldest, newest + 1, self.cluster_max_lines + 1, query):
+            window.extend(page)
+
+        if len(window) > self.cluster_max_lines and len(cluster) > 1:
+            # too many lines between the matches, split the cluster at its widest gap and fetch the halves
+            gaps = [cluster[i].timestamp - cluster[i + 1].timestamp for i in range(len(cluster) - 1)]
+            split = gaps.index(max(gaps)) + 1
+            return [cluster_lines for half in (cluster[:split], cluster[split:]) for cluster_lines in self.get_cluster_lines(logReader, query, half, older_context, newer_context)]
+
+        # one line past the context on each side shows whether the group touches the group of the next cluster
+        newer_lines = self.get_contextual_logs(logReader, query, newest, newer_context + 1, "FORWARD") if newer_context else []
+        older_lines = self.get_contextual_logs(logReader, query, oldest, older_context + 1, "BACKWARD") if older_context else []
+        return [(cluster, list(reversed(newer_lines)) + window + older_lines)]
+
+    @staticmethod
+    def cut_context(cluster, lines, older_context, newer_context):
+        ranges = []
+        match_index = 0
+        for index, item in enumerate(lines):
+            while match_index < len(cluster) and cluster[match_index].timestamp > item.timestamp:
+                match_index += 1
+            if match_index == len(cluster):
+                break
+            match = cluster[match_index]
+            if item.timestamp == match.timestamp and item.line == match.line:
+                ranges.append((max(0, index - newer_context), min(len(lines), index + older_context + 1)))
+                match_index += 1
+
+        groups = []
+        for start, end in ranges:
+            if groups and start <= groups[-1][1]:
+                groups[-1][1] = max(groups[-1][1], end)
+            else:
+                groups.append([start, end])
+        # every group comes with the lines just before and after it, if they were fetched
+        return [(lines[start:end], lines[start - 1] if start else None, lines[end] if end < len(lines) else None) for start, end in groups]
+
+    @staticmethod
+    def is_same_line(item, other):
+        return item is not None and other is not None and item.timestamp == other.timestamp and item.line == other.line
+
+    @staticmethod
+    def contains_line(context, item):
+        # the context is newest first, so only its tail can hold a line as old as item
+        for line in reversed(context):
+            if line.timestamp > item.timestamp:
+                return False
+            if line.timestamp == item.timestamp and line.line == item.line:
+                return True
+        return False
+
     @staticmethod
     def get_context_params(context, older_context, newer_context):
         try:
@@ -64,69 +157,46 @@ class ContextualLogs:
             raise e
 
     @staticmethod
-    def pretty_print(logs, regex_query):
+    def format_labels(item, show_labels):
+        labels = item.labels
+        return "[" + " ".join(f"{label}={labels.get(label, '')}" for label in show_labels) + "] "
+
+    def format_lines(self, logs, regex_query, show_labels=None):
+        highlight = Highlighter(regex_query, self.sink.color).highlight
+
+        for item in logs:
+            prefix = self.format_labels(item, show_labels) if show_labels else ""
+            if item.source is not None:
+                prefix = item.source.ljust(self.source_width) + "  " + prefix
+            yield prefix + highlight(item.line)
+
+    def pretty_print(self, logs, regex_query, show_labels=None):
         try:
-            colorama.init()
-
-            highlight_color = colorama.Fore.RED
-            reset_color = colorama.Style.RESET_ALL
-            style_color = colorama.Style.BRIGHT
-
-            for item in logs:
-                if regex_query:
-                    matches = list(re.finditer(regex_query, item["log"]))
-                    if matches:
-                        highlighted_log = item["log"]
-                        for match in reversed(matches):
-                            start, end = match.span()
-                            matched_text = item["log"][start:end]
-                            highlighted_text = highlight_color + style_color + matched_text + reset_color
-                            highlighted_log = highlighted_log[:start] + highlighted_text + highlighted_log[end:]
-
-                        print(highlighted_log)
-                    else:
-                        print(item["log"])
-                else:
-                    print(item["log"])
+            self.sink.write_lines(self.format_lines(logs, regex_query, show_labels))
         except Exception as e:
             logging.error(f"Error pretty printing logs: {e}")
             raise e
 
-    def print_contextual_logs(self, logs, logReader, app_name, older_context, newer_context, from_time, to_time, since, access_token, regex_query, current_context):
+    def print_contextual_logs(self, pages, logReader, query, older_context, newer_context, regex_query, show_labels=None):
+        # takes every page of matches, the context of the last group of a page may continue on the next one
         try:
-            for item in logs:
-                if newer_context:
-                    forward_contextual_logs = self.get_contextual_logs(logReader, app_name, newer_context, from_time, to_time, since, access_token, item, "FORWARD")
-                    if older_context:
-                        backward_contextual_logs = self.get_contextual_logs(logReader, app_name, older_context, from_time, to_time, since, access_token, item, "BACKWARD")
-
-                if older_context and not newer_context:
-                    backward_contextual_logs = self.get_contextual_logs(logReader, app_name, older_context, from_time, to_time, since, access_token, item, "BACKWARD")
-                    backward_contextual_logs.insert(0, item)
-
-                if current_context:
-                    if newer_context and forward_contextual_logs[-1]["timestamp"] >= current_context[-1]["timestamp"]:
-                        full_context = list(reversed(forward_contextual_logs))
-                        if older_context:
-                            full_context.extend(backward_contextual_logs)
-                        current_context = self.merge_lists(current_context, full_context)
-
-                    elif older_context and backward_contextual_logs[0]["timestamp"] >= current_context[-1]["timestamp"]:
-                        full_context = backward_contextual_logs
-                        current_context = self.merge_lists(current_context, full_context)
-
-                    else:
-                        self.pretty_print(current_context, regex_query)
-                        print("\n---\n")
-                        current_context = []
-
-                if not current_context:
-                    if newer_context:
-                        current_context.extend(list(reversed(forward_contextual_logs)))
-                    if older_context:
-                        current_context.extend(backward_contextual_logs)
-
-            self.pretty_print(current_context, regex_query)
+            current_context, next_line = [], None
+            for cluster in self.get_match_clusters(item for logs in pages for item in logs):
+                for cluster_part, lines in self.get_cluster_lines(logReader, query, cluster, older_context, newer_context):
+                    for group, previous_line, following_line in self.cut_context(cluster_part, lines, older_context, newer_context):
+                        # overlapping groups and groups that start on the line after the context are printed as one
+                        if current_context and (self.contains_line(current_context, group[0]) or self.is_same_line(group[0], next_line) or self.is_same_line(previous_line, current_context[-1])):
+                            current_context = self.merge_lists(current_context, group)
+                            if current_context[-1] is group[-1]:
+                                next_line = following_line
+                            continue
+
+                        if current_context:
+                            self.pretty_print(current_context, regex_query, show_labels)
+                            self.sink.write("\n---\n\n")
+                        current_context, next_line = group, following_line
+
+            self.pretty_print(current_context, regex_query, show_labels)
         except Exception as e:
             logging.error(f"Error printing contextual logs: {e}")
-            raise e
\ No newline at end of file
+            raise e
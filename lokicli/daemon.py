@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import logging
+import threading
+import subprocess
+
+from .config import LokiConfig
+
+# commands a running daemon answers, everything else always runs in the calling process
+FORWARDED_COMMANDS = ("logs", "apps")
+
+class _ThreadStream:
+    # stdout of the daemon, every request thread prints to its own client connection
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def set(self, stream):
+        self.local.stream = stream
+
+    def __getattr__(self, name):
+        return getattr(getattr(self.local, "stream", None) or self.default, name)
+
+class _ClientOutput(io.RawIOBase):
+    # holds the output back until loki accepted the login for this request, until then an expired
+    # login can still send the command back to the client, which logs in again in its own terminal
+    def __init__(self, connection):
+        self.connection = connection
+        self.held = []
+        self.status = None
+        self.lock = threading.Lock()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        with self.lock:
+            if self.status == "ok":
+                self.connection.sendall(data)
+            elif self.status is None:
+                self.held.append(bytes(data))
+        return len(data)
+
+    def start(self):
+        with self.lock:
+            if self.status is None:
+                self.status = "ok"
+                LokiDaemon._send_status(self.connection, "ok")
+                self.connection.sendall(b"".join(self.held))
+                self.held = []
+
+    def fall_back(self):
+        # returns False once output has been sent, the client then gets an error instead
+        with self.lock:
+            if self.status == "ok":
+                return False
+            self.status = "fallback"
+            self.held = []
+            LokiDaemon._send_status(self.connection, "fallback")
+            return True
+
+class _RequestTransport:
+    # the daemon's shared transport as one request sees it, the first api call loki answers starts the output
+    def __init__(self, transport, output):
+        self.transport = transport
+        self.output = output
+
+    def get_api(self, url, params=None, timeout=60):
+        response = self.transport.get_api(url, params=params, timeout=timeout)
+        if response.status_code not in (401, 302):
+            self.output.start()
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+class _ClientStream(io.BufferedWriter):
+    # the output sink only colors output when the client's own stdout is a terminal
+    def __init__(self, raw, interactive):
+        super().__init__(raw)
+        self.interactive = interactive
+
+    def isatty(self):
+        return self.interactive
+
+class LokiDaemon:
+    def __init__(self, idle_timeout=None):
+        self.SOCKET_FILE = LokiConfig.get_file_path('lokicli.sock')
+        self.active = 0
+        self.stopping = False
+        self.lock = threading.Lock()
+
+        try:
+            properties = LokiConfig().get_properties()['daemon']
+            self.idle_timeout = idle_timeout if idle_timeout is not None else int(properties['idleTimeoutSeconds'])
+        except Exception as e:
+            logging.error(f"Error getting daemon properties: {e}")
+            raise e
+
+    @staticmethod
+    def start_detached(idle_timeout=None):
+        command = [sys.executable, "-m", "lokicli.lokicli", "serve"]
+        if idle_timeout is not None:
+            command += ["--idle-timeout", str(idle_timeout)]
+        with open(os.devnull, "r+b") as devnull:
+            subprocess.Popen(command, stdin=devnull, stdout=devnull, stderr=devnull, start_new_session=True)
+
+    def _bind(self):
+        if DaemonClient().is_running():
+            logging.error("The lokicli daemon is already running.")
+            raise ValueError("The lokicli daemon is already running.")
+        if os.path.exists(self.SOCKET_FILE):
+            # left behind by a daemon that did not stop cleanly
+            os.unlink(self.SOCKET_FILE)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            # the daemon sends requests with the user's cookies, so only the user may connect
+            server.bind(self.SOCKET_FILE)
+        finally:
+            os.umask(umask)
+        server.listen(64)
+        server.settimeout(1)
+        return server
+
+    def serve(self):
+        from .lokicli import get_parser
+        from .transport import LokiTransport
+
+        if not hasattr(socket, "AF_UNIX"):
+            logging.error("lokicli serve needs Unix domain sockets.")
+            raise ValueError("lokicli serve needs Unix domain sockets.")
+
+        # a client that goes away must only end its own request, not the daemon
+        if hasattr(signal, "SIGPIPE"):
+            signal.signal(signal.SIGPIPE, signal.SIG_IGN)
+        self.parser = get_parser()
+        self.transport = LokiTransport()
+        sys.stdout = _ThreadStream(sys.stdout)
+
+        server = self._bind()
+        print(f"lokicli daemon listening on {self.SOCKET_FILE}, stops after {self.idle_timeout}s without requests.")
+        last_request = time.monotonic()
+        try:
+            while not self.stopping:
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    with self.lock:
+                        if self.active:
+                            last_request = time.monotonic()
+                    if self.idle_timeout > 0 and time.monotonic() - last_request > self.idle_timeout:
+                        logging.info("Stopping the lokicli daemon after being idle.")
+                        break
+                    continue
+
+                last_request = time.monotonic()
+                connection.settimeout(None)
+                threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+        finally:
+            server.close()
+            os.unlink(self.SOCKET_FILE)
+            self.transport.close()
+
+    @staticmethod
+    def _send_status(connection, status):
+        connection.sendall((json.dumps({"status": status}) + "\n").encode())
+
+    def handle(self, connection):
+        from .lokicli import LokiCLI, run_command
+        from .errors import AuthenticationError
+
+        with self.lock:
+            self.active += 1
+        stream = None
+        try:
+            with connection, connection.makefile("rb") as reader:
+                request = json.loads(reader.readline())
+                if request.get("command") == "stop":
+                    self.stopping = True
+                    self._send_status(connection, "stopped")
+                    return
+
+                args = self.parser.parse_args(request["argv"])
+                output = _ClientOutput(connection)
+                loki = LokiCLI(_RequestTransport(self.transport, output), interactive=False)
+                try:
+                    logged_in = loki.is_logged_in(args.project)
+                except Exception as e:
+                    logging.error(f"Error checking login in the daemon: {e}")
+                    logged_in = False
+                if not logged_in:
+                    # logging in needs the user's terminal, so the client runs this command itself
+                    output.fall_back()
+                    return
+
+                stream = io.TextIOWrapper(_ClientStream(output, request.get("interactive", False)), encoding="utf-8", write_through=True)
+                sys.stdout.set(stream)
+                try:
+                    run_command(loki, self.parser, args)
+                except AuthenticationError as e:
+                    if output.fall_back():
+                        return
+                    print(f"Error: {e}")
+                except Exception as e:
+                    print(f"Error: {e}")
+                stream.flush()
+                output.start()
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            logging.error(f"Error handling daemon request: {e}")
+        finally:
+            sys.stdout.set(None)
+            if stream:
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+            with self.lock:
+                self.active -= 1
+
+class DaemonClient:
+    def __init__(self):
+        self.SOCKET_FILE = LokiConfig.get_file_path('lokicli.sock')
+
+    @staticmethod
+    def can_forward(args):
+        # files given on the command line are relative to the caller, those commands run locally
+        if args.command not in FORWARDED_COMMANDS or os.environ.get("LOKICLI_NO_DAEMON"):
+            return False
+        return not (args.command == "logs" and (args.out or args.from_store))
+
+    def _connect(self):
+        if not hasattr(socket, "AF_UNIX") or not os.path.exists(self.SOCKET_FILE):
+            return None
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(self.SOCKET_FILE)
+            return connection
+        except OSError:
+            connection.close()
+            return None
+
+    def is_running(self):
+        connection = self._connect()
+        if connection:
+            connection.close()
+        return connection is not None
+
+    def _send(self, connection, request):
+        connection.sendall((json.dumps(request) + "\n").encode())
+        status = b""
+        while not status.endswith(b"\n"):
+            chunk = connection.recv(1)
+            if not chunk:
+                return None
+            status += chunk
+        return json.loads(status)["status"]
+
+    def forward(self, argv):
+        # returns False when the daemon is not running or asks the caller to run the command itself
+        connection = self._connect()
+        if not connection:
+            return False
+
+        with connection:
+            if self._send(connection, {"argv": argv, "interactive": sys.stdout.isatty()}) != "ok":
+                return False
+
+            sys.stdout.flush()
+            while True:
+                chunk = connection.recv(256 * 1024)
+                if not chunk:
+                    break
+                sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.flush()
+        return True
+
+    def stop(self):
+        connection = self._connect()
+        if not connection:
+            print("The lokicli daemon is not running.")
+            return
+
+        with connection:
+            self._send(connection, {"command": "stop"})
+        # the daemon removes the socket once it has left its accept loop
+        for _ in range(50):
+            if not os.path.exists(self.SOCKET_FILE):
+                break
+            time.sleep(0.1)
+        print("Stopped the lokicli daemon.")
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import json
+from operator import attrgetter
+
+from .log_record import LogRecord
+
+_raw_decode = json.JSONDecoder().raw_decode
+
+def _json_loads_line(line):
+    # json.loads minus its type and BOM checks and the python level decode() call, it runs once per line
+    value, end = _raw_decode(line)
+    if end != len(line) and line[end:].strip():
+        raise ValueError(f"Extra data at {end}")
+    return value
+
+try:
+    import orjson
+    _loads = _loads_line = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import simdjson
+        _loads = _loads_line = simdjson.loads
+        JSON_BACKEND = "simdjson"
+    except ImportError:
+        _loads = json.loads
+        _loads_line = _json_loads_line
+        JSON_BACKEND = "json"
+
+class LogDecoder:
+    @staticmethod
+    def loads(body):
+        return _loads(body)
+
+    @staticmethod
+    def extract_log(line):
+        # lines shipped by docker/cri are wrapped as {"log": "...", "stream": ...}, anything else is printed as is
+        if not line.startswith("{"):
+            return line
+        try:
+            value = _loads_line(line)
+        except ValueError:
+            return line
+        if isinstance(value, dict) and isinstance(value.get("log"), str):
+            return value["log"]
+        return line
+
+    @staticmethod
+    def decode_streams(result, direction):
+        # every stream is already sorted in the requested direction, timsort merges those runs in C and
+        # keeps lines with equal timestamps in stream order, like a k-way merge would
+        extract_log = LogDecoder.extract_log
+        records = [LogRecord(int(timestamp), extract_log(line), stream["stream"]) for stream in result for timestamp, line in stream["values"]]
+        if len(result) > 1:
+            records.sort(key=attrgetter("timestamp"), reverse=direction == "BACKWARD")
+        return records
+
+    @staticmethod
+    def decode_response(body, direction):
+        # parsing the raw bytes skips requests' charset detection and the extra str copy of response.json()
+        return LogDecoder.decode_streams(_loads(body)["data"]["result"], direction)
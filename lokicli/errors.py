@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+class LokiError(Exception):
+    pass
+
+class AuthenticationError(LokiError):
+    # there is no saved login for the project or the gateway no longer accepts it
+    pass
+
+class InvalidArgumentError(LokiError, ValueError):
+    # an argument such as the limit, the time range or the parallelism is out of range or badly formatted
+    pass
+
+class TransportError(LokiError):
+    # the gateway could not be reached, or the connection failed after every retry
+    pass
+
+class AppNotFoundError(LokiError, ValueError):
+    # the app has no streams in the project for the time range
+    pass
+
+class QueryError(LokiError):
+    # loki answered the query with an error
+    pass
+
+class QueryLimitError(QueryError):
+    # loki refused the query because it would read too much, a smaller time window may pass
+    pass
+
+class QueryTimeoutError(QueryError):
+    # the query did not finish in time on the gateway or query frontend
+    pass
+
+class PageLimitError(QueryError):
+    # the page asked for more lines than loki's max_entries_limit_per_query allows, a smaller page passes
+    pass
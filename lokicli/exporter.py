@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import gzip
+import json
+import logging
+import tempfile
+
+from .log_cursor import LogCursor
+
+class LogExporter:
+    def __init__(self, logReader, path):
+        self.logReader = logReader
+        self.path = path
+        self.CHECKPOINT_FILE = path + ".checkpoint"
+        self.compress = path.endswith(".gz")
+        self.lines = 0
+
+    def load_checkpoint(self):
+        try:
+            if os.path.exists(self.CHECKPOINT_FILE):
+                with open(self.CHECKPOINT_FILE, "r") as file:
+                    return json.load(file)
+        except Exception as e:
+            logging.error(f"Error loading export checkpoint {self.CHECKPOINT_FILE}: {e}")
+            raise e
+        return None
+
+    def save_checkpoint(self, checkpoint):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.CHECKPOINT_FILE)), prefix=".checkpoint-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(checkpoint, file)
+            os.replace(tmp_path, self.CHECKPOINT_FILE)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def encode(self, page):
+        data = "".join(json.dumps({"timestamp": str(item.timestamp), "labels": item.labels, "log": item.line}, ensure_ascii=False) + "\n" for item in page).encode()
+        # every page is its own gzip member, so the file can be cut after any page and still be read with gunzip
+        return gzip.compress(data, 6) if self.compress else data
+
+    def export(self, query, start_time, end_time, limit, resume=False):
+        checkpoint = self.load_checkpoint() if resume else None
+        if resume and not checkpoint:
+            logging.error(f"No checkpoint found for {self.path}.")
+            raise ValueError(f"No checkpoint found for {self.path}, nothing to resume. Please run the export without --resume.")
+        if checkpoint and checkpoint["query"] != query:
+            logging.error(f"Checkpoint of {self.path} is for a different query: {checkpoint['query']}")
+            raise ValueError(f"Checkpoint of {self.path} is for a different query: {checkpoint['query']}. Please use the same app, query and project to resume.")
+
+        if checkpoint:
+            cursor = LogCursor.from_dict(checkpoint["cursor"])
+            self.lines = checkpoint["lines"]
+            file = open(self.path, "r+b")
+            # anything written after the last checkpoint is fetched again, cut it off to avoid duplicates
+            file.truncate(checkpoint["bytes"])
+            file.seek(checkpoint["bytes"])
+        else:
+            cursor = LogCursor(start_time, end_time, max_page_limit=self.logReader.batch_controller.max_batch_size)
+            self.lines = 0
+            file = open(self.path, "wb")
+
+        try:
+            with file:
+                for page in self.logReader.iter_pages(None, None, limit - self.lines, query, cursor):
+                    file.write(self.encode(page))
+                    file.flush()
+                    os.fsync(file.fileno())
+                    self.lines = self.lines + len(page)
+                    self.save_checkpoint({"query": query, "cursor": cursor.to_dict(), "lines": self.lines, "bytes": file.tell()})
+        except Exception as e:
+            logging.error(f"Error exporting logs to {self.path} after {self.lines} lines: {e}")
+            raise e
+
+        if os.path.exists(self.CHECKPOINT_FILE):
+            os.remove(self.CHECKPOINT_FILE)
+        return self.lines
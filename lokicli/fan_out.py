@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import heapq
+import logging
+import queue
+import itertools
+import threading
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor
+
+from .app_map_utils import AppMapUtils
+from .parallel_fetcher import _SHARD_DONE
+
+class FanOutFetcher:
+    def __init__(self, sources, prefetch_pages=2):
+        # every source is a (project, ParallelFetcher, query) triple, one per project and app group
+        self.sources = sources
+        self.prefetch_pages = prefetch_pages
+        self.stop_event = threading.Event()
+
+    def _put(self, pages, item):
+        while not self.stop_event.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch_source(self, fetcher, start_time, end_time, limit, query, pages):
+        try:
+            for page in fetcher.iter_pages(start_time, end_time, limit, query):
+                if not self._put(pages, page):
+                    return
+        except BaseException as e:
+            logging.error(f"Error fetching {query}: {e}")
+            self._put(pages, e)
+        finally:
+            self._put(pages, _SHARD_DONE)
+
+    @staticmethod
+    def _iter_source(project, pages):
+        names = {}
+        while True:
+            page = pages.get()
+            if page is _SHARD_DONE:
+                return
+            if isinstance(page, BaseException):
+                raise page
+
+            for item in page:
+                labels = item.labels
+                key = (labels.get("app"), labels.get("instance"), labels.get("namespace"))
+                source = names.get(key)
+                if source is None:
+                    source = names[key] = project if None in key else f"{project}/{AppMapUtils.get_app_name(labels)}"
+                item.source = source
+                yield item
+
+    def iter_logs(self, start_time, end_time, limit):
+        source_queues = [queue.Queue(maxsize=self.prefetch_pages) for _ in self.sources]
+        executor = ThreadPoolExecutor(max_workers=len(self.sources))
+
+        try:
+            for (project, fetcher, query), pages in zip(self.sources, source_queues):
+                executor.submit(self._fetch_source, fetcher, start_time, end_time, limit, query, pages)
+
+            # every source is newest first, the merge keeps that order across apps and projects
+            merged = heapq.merge(*(self._iter_source(project, pages) for (project, _, _), pages in zip(self.sources, source_queues)), key=attrgetter("timestamp"), reverse=True)
+            yield from itertools.islice(merged, limit)
+        finally:
+            self.stop_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import re
+import logging
+import functools
+
+from .query_planner import QueryPlanner
+
+HIGHLIGHT = "\x1b[31m\x1b[1m"
+RESET = "\x1b[0m"
+
+POSIX_CLASSES = {
+    "alnum": "0-9A-Za-z",
+    "alpha": "A-Za-z",
+    "ascii": "\\x00-\\x7F",
+    "blank": "\\t ",
+    "cntrl": "\\x00-\\x1F\\x7F",
+    "digit": "0-9",
+    "graph": "!-~",
+    "lower": "a-z",
+    "print": " -~",
+    "punct": "!-/:-@\\[-`{-~",
+    "space": "\\t\\n\\v\\f\\r ",
+    "upper": "A-Z",
+    "word": "0-9A-Za-z_",
+    "xdigit": "0-9A-Fa-f",
+}
+
+class Highlighter:
+    def __init__(self, regex_query, color):
+        queries = [regex_query] if isinstance(regex_query, str) else list(regex_query or [])
+        queries = [query for query in queries if query]
+        literals = [QueryPlanner.as_literal(query) for query in queries]
+
+        # a single plain-text query is highlighted with a substring replace instead of a regex scan
+        self.literal = literals[0] if color and len(literals) == 1 and literals[0] else None
+        self.pattern = None
+        self.replacement = HIGHLIGHT + r"\g<0>" + RESET
+
+        if color and queries and self.literal is None:
+            combined = "|".join(re.escape(literal) if literal else f"(?:{query})" for query, literal in zip(queries, literals))
+            self.pattern = self.compile(queries[0] if len(queries) == 1 else combined)
+
+        if self.pattern is not None and self.pattern.search("") is not None:
+            # patterns that can match the empty string would wrap every position in colour codes
+            self.replacement = lambda match: HIGHLIGHT + match.group(0) + RESET if match.group(0) else ""
+
+    @staticmethod
+    def translate(regex_query):
+        # turns the RE2 syntax loki accepts into the python re equivalent where the two differ
+        translated = []
+        in_class = False
+        i = 0
+        while i < len(regex_query):
+            char = regex_query[i]
+            if char == "\\" and i + 1 < len(regex_query):
+                escaped = regex_query[i + 1]
+                if escaped == "Q":
+                    end = regex_query.find("\\E", i + 2)
+                    end = len(regex_query) if end == -1 else end
+                    translated.append(re.escape(regex_query[i + 2:end]))
+                    i = end + 2
+                    continue
+                translated.append({"z": "\\Z", "C": "."}.get(escaped, regex_query[i:i + 2]) if not in_class else regex_query[i:i + 2])
+                i += 2
+                continue
+
+            if in_class:
+                posix_class = re.match(r"\[:(\w+):\]", regex_query[i:])
+                if posix_class and posix_class.group(1) in POSIX_CLASSES:
+                    translated.append(POSIX_CLASSES[posix_class.group(1)])
+                    i += posix_class.end()
+                    continue
+                if char == "]":
+                    in_class = False
+            elif char == "[":
+                in_class = True
+                translated.append(char)
+                i += 1
+                # a leading ] (after an optional ^) is a literal inside the class
+                if regex_query.startswith("^", i):
+                    translated.append("^")
+                    i += 1
+                if regex_query.startswith("]", i):
+                    translated.append("\\]")
+                    i += 1
+                continue
+            elif regex_query.startswith("(?<", i) and regex_query[i + 3:i + 4] not in ("=", "!"):
+                translated.append("(?P<")
+                i += 3
+                continue
+
+            translated.append(char)
+            i += 1
+        return "".join(translated)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def compile(regex_query):
+        try:
+            return re.compile(Highlighter.translate(regex_query))
+        except re.error as e:
+            # loki already accepted the query, so only the highlighting is lost
+            logging.warning(f"Cannot highlight query {regex_query}: {e}")
+            return None
+
+    def highlight(self, line):
+        if self.literal is not None:
+            return line.replace(self.literal, HIGHLIGHT + self.literal + RESET)
+        if self.pattern is None:
+            return line
+        return self.pattern.sub(self.replacement, line)
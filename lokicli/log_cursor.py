@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import hashlib
+import logging
+
+class LogCursor:
+    def __init__(self, start_time, end_time, direction="BACKWARD", max_page_limit=5000):
+        self.start_time = int(start_time)
+        self.end_time = int(end_time)
+        self.direction = direction
+        self.max_page_limit = max_page_limit
+        self.boundary = None
+        self.boundary_lines = set()
+        self.skip_boundary = False
+        self.widen = 1
+        self.split_time = None
+        self.done = self.start_time >= self.end_time
+
+    @staticmethod
+    def line_hash(item):
+        labels = ",".join(f"{key}={value}" for key, value in sorted(item.labels.items()))
+        return hashlib.blake2b(f"{labels}\0{item.line}".encode(), digest_size=8).digest()
+
+    def get_window(self):
+        # the boundary timestamp stays inclusive so lines sharing it with the previous page are not lost,
+        # unless the cursor had to give up on it
+        if self.boundary is None:
+            window_start, window_end = self.start_time, self.end_time
+        elif self.direction == "BACKWARD":
+            window_start, window_end = self.start_time, self.boundary if self.skip_boundary else self.boundary + 1
+        else:
+            window_start, window_end = self.boundary + 1 if self.skip_boundary else self.boundary, self.end_time
+
+        if self.split_time is not None:
+            # only the part of a split window next to the boundary is queried until it is exhausted
+            if self.direction == "BACKWARD":
+                window_start = max(window_start, self.split_time)
+            else:
+                window_end = min(window_end, self.split_time)
+        return window_start, window_end
+
+    def split(self, min_window=10**9):
+        window_start, window_end = self.get_window()
+        if window_end - window_start < 2 * min_window:
+            return False
+        self.split_time = window_start + (window_end - window_start) // 2
+        self.widen = 1
+        return True
+
+    def to_dict(self):
+        return {
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "direction": self.direction,
+            "max_page_limit": self.max_page_limit,
+            "boundary": self.boundary,
+            "boundary_lines": sorted(line_hash.hex() for line_hash in self.boundary_lines),
+            "skip_boundary": self.skip_boundary,
+            "widen": self.widen,
+            "split_time": self.split_time,
+            "done": self.done,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        cursor = cls(state["start_time"], state["end_time"], state["direction"], state["max_page_limit"])
+        cursor.boundary = state["boundary"]
+        cursor.boundary_lines = {bytes.fromhex(line_hash) for line_hash in state["boundary_lines"]}
+        cursor.skip_boundary = state["skip_boundary"]
+        cursor.widen = state["widen"]
+        cursor.split_time = state.get("split_time")
+        cursor.done = state["done"]
+        return cursor
+
+    def seek(self, timestamp, line_hashes):
+        self.boundary = int(timestamp)
+        self.boundary_lines = set(line_hashes)
+        self.skip_boundary = False
+
+    def extend(self, end_time):
+        # lets a follow-mode poller keep paging forward into time that has passed since the last poll
+        self.end_time = int(end_time)
+        self.done = self.get_window()[0] >= self.end_time
+
+    def get_page_limit(self, limit):
+        return min(limit * self.widen, max(limit, self.max_page_limit))
+
+    def advance(self, page, page_limit):
+        if len(page) < page_limit and self.split_time is not None:
+            # the split part of the window is exhausted, carry on with the rest of the window
+            new_lines = [item for item in page if item.timestamp != self.boundary or self.line_hash(item) not in self.boundary_lines]
+            self.boundary = self.split_time
+            self.boundary_lines = set()
+            self.skip_boundary = self.direction == "BACKWARD"
+            self.split_time = None
+            self.widen = 1
+            self.done = self.boundary <= self.start_time if self.direction == "BACKWARD" else self.boundary >= self.end_time
+            return new_lines
+
+        if len(page) < page_limit:
+            # loki returns a short page only once the window is exhausted
+            self.done = True
+        if not page:
+            return []
+
+        new_lines = [item for item in page if item.timestamp != self.boundary or self.line_hash(item) not in self.boundary_lines]
+
+        last_timestamp = page[-1].timestamp
+        if last_timestamp != self.boundary or self.skip_boundary:
+            self.boundary = last_timestamp
+            self.boundary_lines = set()
+            self.skip_boundary = False
+        self.boundary_lines.update(self.line_hash(item) for item in page if item.timestamp == last_timestamp)
+
+        if new_lines or self.done:
+            self.widen = 1
+        elif page_limit >= self.max_page_limit:
+            logging.warning(f"More than {page_limit} lines share timestamp {self.boundary}, skipping the rest of them.")
+            self.skip_boundary = True
+            self.widen = 1
+        else:
+            # the whole page is one timestamp that was already returned, ask for more lines at once
+            self.widen = self.widen * 2
+
+        if self.direction == "BACKWARD" and self.skip_boundary and self.boundary <= self.start_time:
+            self.done = True
+        if self.direction == "FORWARD" and self.skip_boundary and self.boundary + 1 >= self.end_time:
+            self.done = True
+        return new_lines
@@ -1,67 +1,101 @@
 #!/usr/bin/env python3
 
-import requests
-import json
+import time
 import logging
+import requests
 import configparser
 
 from .time_utils import LokiTimeUtils
 from .app_map_utils import AppMapUtils
 from .config import LokiConfig
-from .auth import Auth
+from .log_cursor import LogCursor
+from .decoder import LogDecoder
+from .batch_controller import BatchSizeController
+from .query_planner import QueryPlanner
+from .result_cache import ResultCache
+from .errors import InvalidArgumentError, TransportError, AppNotFoundError, AuthenticationError, QueryError, QueryLimitError, QueryTimeoutError, PageLimitError
+
+QUERY_LIMIT_ERRORS = ("too many bytes", "max_query_series", "maximum of series", "too many chunks", "max_chunks_per_query", "query time range exceeds the limit")
+QUERY_TIMEOUT_ERRORS = ("context deadline exceeded", "query_timeout", "timeout exceeded", "timed out")
 
 class LogReader:
-    def __init__(self, project, url):
-        self.logs = []
+    def __init__(self, project, url, transport):
         self.project = project
         self.url = url
+        self.transport = transport
+        self.stream_selector = ""
 
         try:
             properties = LokiConfig().get_properties()
             self.batch_size = int(properties['logReader']['batchSize'])
+            self.max_batch_size = int(properties['logReader']['maxBatchSize'])
+            self.adaptive_batch_size = properties['logReader']['adaptiveBatchSize'].lower() == 'true'
+            self.target_latency = float(properties['logReader']['targetLatencySeconds'])
+            self.target_page_bytes = int(properties['logReader']['targetPageBytes'])
+            cache_properties = properties['resultCache']
+            self.result_cache = None
+            if cache_properties['enabled'].lower() == 'true':
+                self.result_cache = ResultCache(project, cache_properties['chunkSeconds'], cache_properties['closedAfterSeconds'], cache_properties['maxSizeMb'])
         except Exception as e:
             logging.error(f"Error getting batch size: {e}")
             raise e
 
-    def _get_log_query(self, app_name, regex_query, invert_match):
+        self.batch_controller = self._get_batch_controller(project)
+
+    def _get_batch_controller(self, key):
+        return BatchSizeController(key, self.batch_size, self.max_batch_size, self.target_latency, self.target_page_bytes, self.adaptive_batch_size)
+
+    def _get_log_query(self, app_name, regex_query, invert_match, pipeline=None):
         try:
             app, namespace, instance = app_name["app"], app_name["namespace"], app_name["instance"]
             query = f'{{app="{app}",namespace="{namespace}",instance="{instance}"}}'
-            operator = ' !~ `' if invert_match else ' |~ `'
-            query = query + operator + regex_query + '`' if regex_query else query
-            return query
+            return query + QueryPlanner(regex_query, invert_match, pipeline).get_pipeline()
         except Exception as e:
             logging.error(f"Error getting query: {e}")
             raise e
 
-    def build_params(self, start_time, current_end_time, limit, query):
+    def build_params(self, start_time, current_end_time, limit, query, direction="BACKWARD"):
         return {
-            "direction": "BACKWARD",
+            "direction": direction,
             "end": current_end_time,
-            "limit": limit if limit < self.batch_size else self.batch_size,
+            "limit": limit,
             "query": query,
             "start": start_time,
         }
 
-    def fetch_logs(self, params, access_token):
+    def fetch_logs(self, params, record_stats=False):
         try:
-            cookies = {"_oauth2_proxy": access_token}
-            response = requests.get(f"{self.url}/loki/api/v1/query_range", cookies=cookies, params=params, timeout=60)
+            request_start = time.monotonic()
+            try:
+                response = self.transport.get_api(f"{self.url}/loki/api/v1/query_range", params=params, timeout=60)
+            except TransportError as e:
+                # a read timeout is a slow query, a smaller window may finish in time
+                if not isinstance(e.__cause__, requests.exceptions.Timeout):
+                    raise e
+                self.batch_controller.record_failure()
+                raise QueryTimeoutError(f"Query timed out: {e.__cause__}") from e
 
             if response.status_code != 200:
                 logging.error(f"Error fetching logs: {response.status_code}. Response: {response.text}")
+                if response.status_code in (401, 302):
+                    raise AuthenticationError(f"Loki did not accept the login for {self.project}. Please run lokicli login -p {self.project}.")
+                if response.status_code >= 500:
+                    self.batch_controller.record_failure()
+                    if response.status_code in (502, 503, 504) or any(error in response.text for error in QUERY_TIMEOUT_ERRORS):
+                        raise QueryTimeoutError(f"Error fetching logs: {response.status_code}. Response: {response.text}")
+                if any(error in response.text for error in QUERY_LIMIT_ERRORS):
+                    raise QueryLimitError(f"Error fetching logs: {response.status_code}. Response: {response.text}")
+                if self.batch_controller.learn_max_batch_size(response.text) and params["limit"] > self.batch_controller.max_batch_size:
+                    raise PageLimitError(f"Page limit {params['limit']} exceeds the server max entries limit {self.batch_controller.max_batch_size}.")
                 if 'parse error' in response.text:
-                    raise Exception(f"Error fetching logs: {response.status_code}. Please ensure the regex query is according to the Google RE2 syntax. {response.text}")
+                    raise QueryError(f"Error fetching logs: {response.status_code}. Please ensure the regex query is according to the Google RE2 syntax and the pipeline is valid LogQL. {response.text}")
                 else:
-                    raise Exception(f"Error fetching logs: {response.status_code}. Response: {response.text}")
+                    raise QueryError(f"Error fetching logs: {response.status_code}. Response: {response.text}")
             
-            result = response.json()["data"]["result"]
-            self.logs = []
-            
-            if len(result):
-                log_values = result[0]["values"]
-                for item in log_values:
-                    self.logs.append({"log":json.loads(item[1])["log"], "timestamp": item[0]})
+            logs = LogDecoder.decode_response(response.content, params["direction"])
+
+            if record_stats:
+                self.batch_controller.record(time.monotonic() - request_start, len(response.content), len(logs), params["limit"])
         except KeyboardInterrupt:
             logging.error("Interrupted by user.")
             raise KeyboardInterrupt
@@ -69,35 +103,129 @@ class LogReader:
             logging.error(f"Error fetching logs: {e}")
             raise e
 
-        return self.logs
-
-    def get_processed_params(self, app_name, limit, from_time, to_time, since, regex_query, invert_match, access_token, context):
+        return logs
+
+    def iter_pages(self, start_time, end_time, limit, query, cursor=None):
+        if cursor is None and self.result_cache is not None:
+            yield from self._iter_cached_pages(int(start_time), int(end_time), limit, query)
+            return
+
+        cursor = cursor or LogCursor(start_time, end_time, max_page_limit=self.batch_controller.max_batch_size)
+        for logs in self._fetch_cursor_pages(cursor, limit, query):
+            logs = logs[:limit]
+            limit = limit - len(logs)
+            yield logs
+
+    def _iter_cached_pages(self, start_time, end_time, limit, query):
+        for segment_start, segment_end, cacheable in self.result_cache.split_window(start_time, end_time):
+            if limit <= 0:
+                return
+
+            cursor = LogCursor(segment_start, segment_end, max_page_limit=self.batch_controller.max_batch_size)
+            cached_lines, cached = [], False
+            if cacheable:
+                entry = self.result_cache.load(query, segment_start, segment_end)
+                if entry:
+                    cached_lines, cursor_state = entry
+                    cursor = LogCursor.from_dict(cursor_state) if cursor_state else None
+                    cached = True
+
+            if cached_lines:
+                logs = cached_lines[:limit]
+                limit = limit - len(logs)
+                yield logs
+            if cursor is None or limit <= 0:
+                continue
+
+            # a chunk read only partly because of the limit keeps its cursor, the next run continues from there
+            fetched = []
+            try:
+                for logs in self._fetch_cursor_pages(cursor, limit, query):
+                    fetched.extend(logs)
+                    logs = logs[:limit]
+                    limit = limit - len(logs)
+                    yield logs
+            finally:
+                if cacheable and (fetched or not cached):
+                    self.result_cache.save(query, segment_start, segment_end, cached_lines + fetched, None if cursor.done else cursor.to_dict())
+
+    def _fetch_cursor_pages(self, cursor, limit, query):
+        # yields every line the cursor moved past, the last page can run over the limit
+        while limit > 0 and not cursor.done:
+            window_start, window_end = cursor.get_window()
+            page_limit = cursor.get_page_limit(min(limit, self.batch_controller.batch_size))
+            params = self.build_params(window_start, window_end, page_limit, query, cursor.direction)
+
+            try:
+                logs = self.fetch_logs(params, record_stats=True)
+            except PageLimitError:
+                if page_limit <= self.batch_controller.max_batch_size:
+                    raise
+                # the server allows fewer lines per query than configured, retry with its limit
+                cursor.max_page_limit = self.batch_controller.max_batch_size
+                continue
+            except (QueryLimitError, QueryTimeoutError) as e:
+                if not cursor.split():
+                    raise
+                logging.warning(f"Query over {window_start}-{window_end} failed, retrying it in two halves: {e}")
+                continue
+
+            logs = cursor.advance(logs, page_limit)
+
+            if logs:
+                limit = limit - len(logs)
+                yield logs
+
+    def get_processed_params(self, app_name, limit, from_time, to_time, since, regex_query, invert_match, context, pipeline=None):
         try:
             if limit > 500000:
                 logging.error("Limit cannot be greater than 500000.")
-                raise ValueError("Limit cannot be greater than 500000.")
+                raise InvalidArgumentError("Limit cannot be greater than 500000.")
 
             from_time, to_time = LokiTimeUtils().get_from_and_to_times(from_time, to_time, since)
             start_time = LokiTimeUtils.utc_to_unix_nanosecond_epoch(from_time)
             end_time = LokiTimeUtils.utc_to_unix_nanosecond_epoch(to_time)
-            app_map = AppMapUtils(self.url, self.project).get_app_map(from_time, to_time, access_token)
+            labels = AppMapUtils(self.url, self.project, self.transport).resolve_app(app_name, from_time, to_time)
 
-            if app_name not in app_map:
+            if not labels:
                 logging.error(f"No logs found for {app_name} in {self.project} project for the specified time range.")
-                raise ValueError(f"No logs found for {app_name} in {self.project} project for the specified time range. Please check the app name, project and time range.")
+                raise AppNotFoundError(f"No logs found for {app_name} in {self.project} project for the specified time range. Please check the app name, project and time range.")
 
-            query = self._get_log_query(app_map[app_name], regex_query, invert_match)
+            query = self._get_log_query(labels, regex_query, invert_match, pipeline)
+            self.stream_selector = self._get_log_query(labels, None, False)
+            self.batch_controller = self._get_batch_controller(f"{self.project}/{app_name}")
 
             if context:
                 if not regex_query:
                     logging.error("Context can only be used for a query.")
-                    raise ValueError("Context can only be used for a query.")
+                    raise InvalidArgumentError("Context can only be used for a query.")
 
                 if context > 250:
                     logging.error("Context cannot be greater than 250.")
-                    raise ValueError("Context cannot be greater than 250.")
+                    raise InvalidArgumentError("Context cannot be greater than 250.")
         except Exception as e:
             logging.error(f"Error getting processed params: {e}")
             raise e
 
         return start_time, end_time, limit, query
+
+    def get_fan_out_params(self, app_names, limit, from_time, to_time, regex_query, invert_match, pipeline=None):
+        try:
+            if limit > 500000:
+                logging.error("Limit cannot be greater than 500000.")
+                raise InvalidArgumentError("Limit cannot be greater than 500000.")
+
+            start_time = LokiTimeUtils.utc_to_unix_nanosecond_epoch(from_time)
+            end_time = LokiTimeUtils.utc_to_unix_nanosecond_epoch(to_time)
+            resolved = AppMapUtils(self.url, self.project, self.transport).resolve_apps(app_names, from_time, to_time)
+
+            if not resolved:
+                logging.warning(f"No logs found for {', '.join(app_names)} in {self.project} project for the specified time range.")
+
+            stages = QueryPlanner(regex_query, invert_match, pipeline).get_pipeline()
+            queries = [selector + stages for selector in AppMapUtils.get_group_selectors(resolved.values())]
+        except Exception as e:
+            logging.error(f"Error getting fan out params: {e}")
+            raise e
+
+        return start_time, end_time, limit, sorted(resolved), queries
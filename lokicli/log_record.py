@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+
+class LogRecord:
+    # one log line with its timestamp parsed once, in unix nanoseconds; labels is shared by every line of the
+    # stream and source is only set when lines of several apps or projects are merged
+    __slots__ = ("timestamp", "line", "labels", "source")
+
+    def __init__(self, timestamp, line, labels, source=None):
+        self.timestamp = timestamp
+        self.line = line
+        self.labels = labels
+        self.source = source
+
+    def __iter__(self):
+        return iter((self.timestamp, self.line, self.labels))
+
+    def __repr__(self):
+        return f"LogRecord(timestamp={self.timestamp!r}, line={self.line!r}, labels={self.labels!r})"
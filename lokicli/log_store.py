@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import sqlite3
+import logging
+import functools
+import tempfile
+
+from .highlighter import Highlighter
+from .query_planner import QueryPlanner
+from .log_record import LogRecord
+
+@functools.lru_cache(maxsize=32)
+def _compile(regex_query):
+    return re.compile(Highlighter.translate(regex_query))
+
+def _regexp(regex_query, log):
+    return _compile(regex_query).search(log) is not None
+
+class LogStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.STORE_FILE = os.path.join(directory, "logs.db")
+        self.connection = None
+        self.streams = {}
+
+    def write(self, pages, metadata):
+        # lines are stored oldest first, so the rowid is the position of a line in time and
+        # context around a match is a rowid range
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".logs-", suffix=".tmp")
+        os.close(fd)
+
+        try:
+            connection = sqlite3.connect(tmp_path)
+            try:
+                connection.execute("PRAGMA journal_mode = OFF")
+                connection.execute("PRAGMA synchronous = OFF")
+                connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+                connection.execute("CREATE TABLE streams (id INTEGER PRIMARY KEY, labels TEXT)")
+                connection.execute("CREATE TABLE logs (ts INTEGER NOT NULL, stream INTEGER NOT NULL, log TEXT NOT NULL)")
+                connection.execute("CREATE TEMP TABLE staging (ts INTEGER, stream INTEGER, log TEXT)")
+
+                stream_ids, lines = {}, 0
+                for page in pages:
+                    rows = []
+                    for item in page:
+                        # the decoder shares one labels dict between all lines of a stream
+                        stream = stream_ids.get(id(item.labels))
+                        if stream is None:
+                            stream = stream_ids[id(item.labels)] = connection.execute("INSERT INTO streams (labels) VALUES (?)", (json.dumps(item.labels, sort_keys=True),)).lastrowid
+                        rows.append((item.timestamp, stream, item.line))
+                    connection.executemany("INSERT INTO staging VALUES (?, ?, ?)", rows)
+                    lines = lines + len(rows)
+
+                # pages arrive newest first, so within a timestamp the later staging rows are the older lines
+                connection.execute("INSERT INTO logs SELECT ts, stream, log FROM staging ORDER BY ts, rowid DESC")
+                connection.execute("CREATE INDEX logs_ts ON logs (ts)")
+                connection.executemany("INSERT INTO meta VALUES (?, ?)", [(key, str(value)) for key, value in dict(metadata, lines=lines).items()])
+                connection.commit()
+            finally:
+                connection.close()
+            os.replace(tmp_path, self.STORE_FILE)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return lines
+
+    def open(self):
+        if not os.path.exists(self.STORE_FILE):
+            logging.error(f"No log store found in {self.directory}.")
+            raise ValueError(f"No log store found in {self.directory}. Please run lokicli fetch --into {self.directory} first.")
+
+        self.connection = sqlite3.connect(f"file:{self.STORE_FILE}?mode=ro", uri=True)
+        self.connection.create_function("regexp", 2, _regexp, deterministic=True)
+        self.streams = {stream: json.loads(labels) for stream, labels in self.connection.execute("SELECT id, labels FROM streams")}
+        return self
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def get_metadata(self):
+        return dict(self.connection.execute("SELECT key, value FROM meta"))
+
+    @staticmethod
+    def get_conditions(queries, invert_match):
+        # the same literal and regex split as the query planner uses for loki, literals are a plain instr
+        conditions, params = [], []
+        for query in [query for query in (queries or []) if query]:
+            literal = QueryPlanner.as_literal(query)
+            alternatives = [literal] if literal else QueryPlanner.split_alternation(query)
+            if alternatives:
+                operator = "= 0" if invert_match else "> 0"
+                joiner = " AND " if invert_match else " OR "
+                conditions.append("(" + joiner.join(f"instr(log, ?) {operator}" for _ in alternatives) + ")")
+                params.extend(alternatives)
+            else:
+                try:
+                    _compile(query)
+                except re.error as e:
+                    logging.error(f"Invalid regex query {query}: {e}")
+                    raise ValueError(f"Invalid regex query {query}: {e}")
+                conditions.append("NOT (log REGEXP ?)" if invert_match else "log REGEXP ?")
+                params.append(query)
+        return conditions, params
+
+    def _to_item(self, row):
+        return LogRecord(row[1], row[3], self.streams.get(row[2], {}))
+
+    def iter_matches(self, queries, invert_match, limit, start_time=None, end_time=None):
+        conditions, params = self.get_conditions(queries, invert_match)
+        if start_time is not None:
+            conditions.append("ts >= ? AND ts < ?")
+            params.extend([start_time, end_time])
+
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        yield from self.connection.execute(f"SELECT rowid, ts, stream, log FROM logs{where} ORDER BY rowid DESC LIMIT ?", params + [limit])
+
+    def get_range(self, first_row, last_row):
+        rows = self.connection.execute("SELECT rowid, ts, stream, log FROM logs WHERE rowid BETWEEN ? AND ? ORDER BY rowid DESC", (first_row, last_row))
+        return [self._to_item(row) for row in rows]
+
+    def iter_logs(self, rows):
+        for row in rows:
+            yield self._to_item(row)
+
+    def iter_context_groups(self, rows, older_context, newer_context):
+        # matches come newest first, ranges that overlap or touch are printed as one group, the same rule
+        # ContextualLogs.print_contextual_logs applies to context read from loki
+        group = None
+        for row in rows:
+            first_row, last_row = row[0] - older_context, row[0] + newer_context
+            if group and last_row >= group[0] - 1:
+                group[0] = min(group[0], first_row)
+                continue
+            if group:
+                yield self.get_range(*group)
+            group = [first_row, last_row]
+
+        if group:
+            yield self.get_range(*group)
@@ -1,26 +1,23 @@
 #!/usr/bin/env python3
 
-import requests
+import os
+import sys
+import signal
 import argparse
 import logging
-import re
-import colorama
-from datetime import datetime, timezone
 
 from .subparsers import Subparsers
 from .config import LokiConfig
-from .time_utils import LokiTimeUtils
-from .app_map_utils import AppMapUtils
-from .log_reader import LogReader
-from .auth import Auth
-from .contextual_logs import ContextualLogs
 
+# everything that pulls in requests, sqlite or the decoders is imported by the subcommand that needs it,
+# so `lokicli version` or `lokicli projects` do not pay for the whole client
 class LokiCLI:
-    def __init__(self):
+    def __init__(self, transport=None, interactive=True):
         self.lokiConfig = LokiConfig()
         self.project = self.lokiConfig.load_project()
-        self.url = f"https://loki-gateway.{self.project}.{self.lokiConfig.get_properties()['urlSuffix']}"
-        self.auth = Auth(self.url)
+        self._transport = transport
+        # the daemon has no terminal to log in from, it raises AuthenticationError instead of asking
+        self.interactive = interactive
         self.version = "1.1.1"
 
         try:
@@ -30,6 +27,69 @@ class LokiCLI:
             logging.error(f"Error getting Loki properties file: {e}")
             raise e
 
+    @property
+    def transport(self):
+        if self._transport is None:
+            from .transport import LokiTransport
+            self._transport = LokiTransport()
+        return self._transport
+
+    def _get_projects(self, project):
+        # a comma separated list of projects is only used for this query and is not saved as the current project
+        projects = [name.strip() for name in project.split(",") if name.strip()] if project and "," in project else []
+        for name in projects:
+            if name not in self.valid_projects:
+                logging.error(f"Invalid project: {name}")
+                raise ValueError(f"Invalid project: {name}")
+        return projects
+
+    def _login_project(self, project, verify=False):
+        # the library client only uses a saved login, the cli asks for a new one when there is none
+        from .client import LokiClient
+        from .errors import AuthenticationError
+
+        client = LokiClient(project, self.transport)
+        try:
+            client.login(verify)
+        except AuthenticationError:
+            if not self.interactive:
+                raise
+            print(f"Logging into {project}...")
+            access_token = client.auth.get_new_access_token()
+            if not client.auth.get_auth_status(project, access_token):
+                logging.error(f"Login failed for project {project}.")
+                raise Exception(f"Login failed for project {project}. Please run lokicli login -p {project}.")
+            client.login()
+
+        if self.interactive:
+            self.transport.set_reauthenticate(client.url, lambda: client.auth.reauthenticate(project))
+        else:
+            self.transport.set_reauthenticate(client.url, lambda: self._expire_login(client, project))
+        return client
+
+    @staticmethod
+    def _expire_login(client, project):
+        # the saved cookie is dropped, so the next login in a terminal asks for a new one
+        from .errors import AuthenticationError
+
+        client.auth.delete_access_token(project)
+        logging.error(f"Session for {project} expired.")
+        raise AuthenticationError(f"Session for {project} expired. Please run lokicli login -p {project}.")
+
+    def is_logged_in(self, project):
+        # checks the saved cookies without starting an interactive login
+        from .client import LokiClient
+        from .errors import AuthenticationError
+
+        for name in self._get_projects(project) or [project or self.project]:
+            if name not in self.valid_projects:
+                continue
+            try:
+                LokiClient(name, self.transport).login()
+            except AuthenticationError:
+                return False
+        return True
+
     def _check_project(self, project):
         if not self.project and not project:
             logging.error("Project not set.")
@@ -42,7 +102,6 @@ class LokiCLI:
         try:
             if project in valid_projects:
                 self.project = project
-                self.url = f"https://loki-gateway.{project}.{self.lokiConfig.get_properties()['urlSuffix']}"
                 self.lokiConfig.save_project(project)
             else:
                 raise ValueError(f"Invalid project: {project}")
@@ -53,44 +112,250 @@ class LokiCLI:
     def list_apps(self, from_time, to_time, since, project):
         try:
             self._check_project(project)
-            self.login(project)
-            access_token = self.auth.get_saved_access_token(self.project)
-            
+            client = self.login(project)
+
+            for app_name in client.list_apps(from_time, to_time, since):
+                print(app_name)
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    def _get_sink(output, out):
+        from .output import OutputSink
+
+        # parquet is written by pyarrow itself, everything else goes through the sink
+        return OutputSink.open(out) if out and output != "parquet" else OutputSink()
+
+    @staticmethod
+    def _write_logs(contextualLogs, logs, regex_query, show_labels, output, out, with_source=False):
+        from .record_writer import RecordWriter
+
+        if output == "text":
+            contextualLogs.pretty_print(logs, regex_query, show_labels)
+        else:
+            RecordWriter(output, contextualLogs.sink, out, show_labels, with_source).write(logs)
+
+    def get_logs(self, app_name, limit, from_time, to_time, since, regex_query, project, invert_match, context, older_context, newer_context, parallel, show_labels, pipeline=None, no_cache=False, from_store=None, output="text", out=None):
+        from .app_map_utils import AppMapUtils
+        from .contextual_logs import ContextualLogs
+        from .parallel_fetcher import ParallelFetcher
+
+        if (context or older_context or newer_context) and output != "text":
+            logging.error("Context can only be used with text output.")
+            raise ValueError("Context can only be used with text output.")
+        if from_store:
+            return self.get_store_logs(from_store, limit, from_time, to_time, regex_query, invert_match, context, older_context, newer_context, show_labels, pipeline, output, out)
+
+        app_names = [app_name] if isinstance(app_name, str) else app_name
+        projects = self._get_projects(project)
+        if projects or len(app_names) > 1 or AppMapUtils.is_pattern(app_names[0]):
+            return self.get_fan_out_logs(app_names, limit, from_time, to_time, since, regex_query, projects or project, invert_match, context or older_context or newer_context, parallel, show_labels, pipeline, no_cache, output, out)
+        app_name = app_names[0]
+
+        logReader, sink = None, None
+        try:
+            self._check_project(project)
+            client = self.login(project)
+
+            logReader = client.get_log_reader(no_cache)
+            sink = self._get_sink(output, out)
+            contextualLogs = ContextualLogs(sink)
+            context, older_context, newer_context = contextualLogs.get_context_params(context, older_context, newer_context)
+
+            start_time, end_time, limit, query = logReader.get_processed_params(app_name, limit, from_time, to_time, since, regex_query, invert_match, context, pipeline)
+            fetcher = ParallelFetcher(logReader, parallel)
+            show_labels = show_labels.split(",") if show_labels else None
+
+            pages = fetcher.iter_pages(start_time, end_time, limit, query)
+            if context:
+                contextualLogs.print_contextual_logs(pages, logReader, logReader.stream_selector, older_context, newer_context, regex_query, show_labels)
+            else:
+                self._write_logs(contextualLogs, (item for logs in pages for item in logs), regex_query, show_labels, output, out)
+        except Exception as e:
+            raise e
+        finally:
+            if logReader:
+                logReader.batch_controller.save()
+            if sink:
+                sink.close()
+
+    def get_fan_out_logs(self, app_names, limit, from_time, to_time, since, regex_query, projects, invert_match, context, parallel, show_labels, pipeline=None, no_cache=False, output="text", out=None):
+        from .time_utils import LokiTimeUtils
+        from .contextual_logs import ContextualLogs
+        from .parallel_fetcher import ParallelFetcher
+        from .fan_out import FanOutFetcher
+
+        logReaders, sink = [], None
+        try:
+            if context:
+                logging.error("Context can only be used for a single app in a single project.")
+                raise ValueError("Context can only be used for a single app in a single project.")
+
+            if not isinstance(projects, list):
+                self._check_project(projects)
+                projects = [self.project]
+
             from_time, to_time = LokiTimeUtils().get_from_and_to_times(from_time, to_time, since)
-            app_map = AppMapUtils(self.url, self.project).get_app_map(from_time, to_time, access_token)
-            for key in sorted(app_map.keys()):
-                print(key)
+            sources, source_names = [], []
+            for project in projects:
+                logReader = self._login_project(project).get_log_reader(no_cache)
+                logReaders.append(logReader)
+                start_time, end_time, limit, app_names_found, queries = logReader.get_fan_out_params(app_names, limit, from_time, to_time, regex_query, invert_match, pipeline)
+                sources += [(project, ParallelFetcher(logReader, parallel), query) for query in queries]
+                source_names += [f"{project}/{name}" for name in app_names_found]
+
+            if not sources:
+                logging.error(f"No logs found for {', '.join(app_names)} in {', '.join(projects)} for the specified time range.")
+                raise ValueError(f"No logs found for {', '.join(app_names)} in {', '.join(projects)} for the specified time range. Please check the app names, projects and time range.")
+
+            sink = self._get_sink(output, out)
+            contextualLogs = ContextualLogs(sink, max(len(name) for name in source_names))
+            show_labels = show_labels.split(",") if show_labels else None
+            self._write_logs(contextualLogs, FanOutFetcher(sources).iter_logs(start_time, end_time, limit), regex_query, show_labels, output, out, with_source=True)
         except Exception as e:
             raise e
+        finally:
+            for logReader in logReaders:
+                logReader.batch_controller.save()
+            if sink:
+                sink.close()
+
+    def get_store_logs(self, directory, limit, from_time, to_time, regex_query, invert_match, context, older_context, newer_context, show_labels, pipeline=None, output="text", out=None):
+        from .time_utils import LokiTimeUtils
+        from .contextual_logs import ContextualLogs
+        from .log_store import LogStore
 
-    def get_logs(self, app_name, limit, from_time, to_time, since, regex_query, project, invert_match, context, older_context, newer_context):
+        store, sink = LogStore(directory), None
         try:
+            if pipeline:
+                logging.error("Pipeline can only be used when querying Loki.")
+                raise ValueError("Pipeline can only be used when querying Loki.")
+
+            sink = self._get_sink(output, out)
+            contextualLogs = ContextualLogs(sink)
+            context, older_context, newer_context = contextualLogs.get_context_params(context, older_context, newer_context)
+            if context and not regex_query:
+                logging.error("Context can only be used for a query.")
+                raise ValueError("Context can only be used for a query.")
+
+            # the store holds a fixed window, so --since does not apply and -f/-t only narrow it
+            start_time, end_time = None, None
+            if from_time or to_time:
+                from_time, to_time = LokiTimeUtils().get_from_and_to_times(from_time, to_time, None)
+                start_time, end_time = LokiTimeUtils.utc_to_unix_nanosecond_epoch(from_time), LokiTimeUtils.utc_to_unix_nanosecond_epoch(to_time)
+
+            show_labels = show_labels.split(",") if show_labels else None
+            matches = store.open().iter_matches(regex_query, invert_match, limit, start_time, end_time)
+            if context:
+                for index, group in enumerate(store.iter_context_groups(matches, older_context, newer_context)):
+                    if index:
+                        sink.write("\n---\n\n")
+                    contextualLogs.pretty_print(group, regex_query, show_labels)
+            else:
+                self._write_logs(contextualLogs, store.iter_logs(matches), regex_query, show_labels, output, out)
+        except Exception as e:
+            raise e
+        finally:
+            store.close()
+            if sink:
+                sink.close()
+
+    def fetch_to_store(self, app_name, limit, from_time, to_time, since, project, parallel, directory, no_cache=False):
+        from .time_utils import LokiTimeUtils
+        from .parallel_fetcher import ParallelFetcher
+        from .log_store import LogStore
+
+        logReader = None
+        try:
+            if limit > 5000000:
+                logging.error("Limit cannot be greater than 5000000.")
+                raise ValueError("Limit cannot be greater than 5000000.")
+
             self._check_project(project)
-            self.login(project)
-            access_token = self.auth.get_saved_access_token(self.project)
+            client = self.login(project)
 
-            logReader = LogReader(self.project, self.url)
-            context, older_context, newer_context = ContextualLogs().get_context_params(context, older_context, newer_context)
+            logReader = client.get_log_reader(no_cache)
+            from_time, to_time = LokiTimeUtils().get_from_and_to_times(from_time, to_time, since)
+            start_time, end_time, _, query = logReader.get_processed_params(app_name, 0, from_time, to_time, None, None, False, 0)
 
-            start_time, end_time, limit, query = logReader.get_processed_params(app_name, limit, from_time, to_time, since, regex_query, invert_match, access_token, context)
-            current_end_time = end_time
+            pages = ParallelFetcher(logReader, parallel).iter_pages(start_time, end_time, limit, query)
+            metadata = {"project": self.project, "app": app_name, "query": query, "from_time": from_time, "to_time": to_time}
+            lines = LogStore(directory).write(pages, metadata)
+            print(f"Stored {lines} log lines of {app_name} from {from_time} to {to_time} in {directory}.")
+        except Exception as e:
+            raise e
+        finally:
+            if logReader:
+                logReader.batch_controller.save()
 
-            while limit > 0 and int(current_end_time) > int(start_time):
-                params = logReader.build_params(start_time, current_end_time, limit, query)
-                logs = logReader.fetch_logs(params, access_token)
+    def export_logs(self, app_name, limit, from_time, to_time, since, regex_query, project, invert_match, path, resume=False, pipeline=None):
+        from .exporter import LogExporter
 
-                if not logs:
-                    break
+        logReader, exporter = None, None
+        try:
+            if limit > 5000000:
+                logging.error("Limit cannot be greater than 5000000.")
+                raise ValueError("Limit cannot be greater than 5000000.")
 
-                limit = limit - len(logs)
-                current_end_time = str(int(logs[-1]["timestamp"]))
+            self._check_project(project)
+            client = self.login(project)
 
-                if context:
-                    ContextualLogs().print_contextual_logs(logs, logReader, app_name, older_context, newer_context, from_time, to_time, since, access_token, regex_query, [])
-                else:
-                    ContextualLogs().pretty_print(logs, regex_query)
+            logReader = client.get_log_reader()
+            start_time, end_time, _, query = logReader.get_processed_params(app_name, 0, from_time, to_time, since, regex_query, invert_match, 0, pipeline)
+
+            exporter = LogExporter(logReader, path)
+            lines = exporter.export(query, start_time, end_time, limit, resume)
+            print(f"Exported {lines} log lines of {app_name} to {path}.")
+        except BaseException as e:
+            if exporter and os.path.exists(exporter.CHECKPOINT_FILE):
+                print(f"Export stopped after {exporter.lines} lines, run the same command with --resume to continue.", file=sys.stderr)
+            raise e
+        finally:
+            if logReader:
+                logReader.batch_controller.save()
+
+    def tail_logs(self, app_name, since, regex_query, project, invert_match, show_labels, poll, delay_for, poll_interval, pipeline=None):
+        from .contextual_logs import ContextualLogs
+        from .output import OutputSink
+        from .tail import LogTailer
+
+        sink = None
+        try:
+            self._check_project(project)
+            client = self.login(project)
+            access_token = client.auth.get_saved_access_token(self.project)
+
+            logReader = client.get_log_reader()
+            sink = OutputSink()
+            contextualLogs = ContextualLogs(sink)
+            show_labels = show_labels.split(",") if show_labels else None
+
+            start_time, end_time, limit, query = logReader.get_processed_params(app_name, 0, None, None, since, regex_query, invert_match, 0, pipeline)
+            LogTailer(logReader, contextualLogs, access_token, regex_query, show_labels, delay_for, poll_interval).follow(query, start_time, poll)
         except Exception as e:
             raise e
+        finally:
+            if sink:
+                sink.flush()
+
+    def get_metrics(self, kind, app_name, from_time, to_time, since, regex_query, project, invert_match, step, by, count_bytes, output, pipeline=None):
+        from .output import OutputSink
+        from .metric_query import MetricQuery
+
+        sink = None
+        try:
+            self._check_project(project)
+            client = self.login(project)
+
+            logReader = client.get_log_reader()
+            sink = OutputSink()
+            start_time, end_time, limit, query = logReader.get_processed_params(app_name, 0, from_time, to_time, since, regex_query, invert_match, 0, pipeline)
+            MetricQuery(logReader, sink).run(query, kind, count_bytes, start_time, end_time, step, by, output)
+        except Exception as e:
+            raise e
+        finally:
+            if sink:
+                sink.flush()
 
     def list_projects(self):
         try:
@@ -103,20 +368,13 @@ class LokiCLI:
             logging.error(f"Error listing Loki projects: {e}")
             raise e
 
-    def login(self, project):
+    def login(self, project, verify=False):
         try:
             self._check_project(project)
-            access_token = self.auth.get_saved_access_token(self.project)
-            
-            if not access_token:
-                access_token = self.auth.get_new_access_token()
-            
-            auth_status = self.auth.get_auth_status(self.project, access_token)
-            if auth_status:
-                print("Login successful.")
-            else:
-                print("Login failed. Please login again. Loading login URL...")
-                self.login(project)
+            # within verifiedTtlSeconds of the last check the cookie is used as is, `lokicli login` always checks it
+            client = self._login_project(self.project, verify)
+            print("Login successful.")
+            return client
         except Exception as e:
             logging.error(f"Error logging into Loki: {e}")
             raise e
@@ -124,33 +382,74 @@ class LokiCLI:
     def get_version(self):
         print("Loki CLI v" + self.version)
 
+def get_parser():
+    parser = argparse.ArgumentParser(description="Loki CLI")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+    Subparsers(subparsers).create_parsers()
+    return parser
+
+def run_command(loki, parser, args):
+    if args.command == "login":
+        loki.login(args.project, verify=True)
+    elif args.command == "set":
+        loki.set_project(args.project)
+    elif args.command == "projects":
+        loki.list_projects()
+    elif args.command == "apps":
+        loki.list_apps(args.from_time, args.to_time, args.since, args.project)
+    elif args.command == "logs":
+        loki.get_logs(args.app, args.limit, args.from_time, args.to_time, args.since, args.query, args.project, args.invert_match, args.context, args.older_context, args.newer_context, args.parallel, args.show_labels, args.pipeline, args.no_cache, args.from_store, args.output, args.out)
+    elif args.command == "fetch":
+        loki.fetch_to_store(args.app, args.limit, args.from_time, args.to_time, args.since, args.project, args.parallel, args.into, args.no_cache)
+    elif args.command == "export":
+        loki.export_logs(args.app, args.limit, args.from_time, args.to_time, args.since, args.query, args.project, args.invert_match, args.out, args.resume, args.pipeline)
+    elif args.command == "tail":
+        loki.tail_logs(args.app, args.since, args.query, args.project, args.invert_match, args.show_labels, args.poll, args.delay_for, args.poll_interval, args.pipeline)
+    elif args.command in ("count", "rate"):
+        loki.get_metrics(args.command, args.app, args.from_time, args.to_time, args.since, args.query, args.project, args.invert_match, args.step, args.by, args.bytes, args.output, args.pipeline)
+    elif args.command == "version":
+        loki.get_version()
+    else:
+        parser.print_help()
+
+def serve(args):
+    from .daemon import LokiDaemon, DaemonClient
+
+    if args.stop:
+        DaemonClient().stop()
+    elif args.detach:
+        LokiDaemon.start_detached(args.idle_timeout)
+        print("Started the lokicli daemon in the background, stop it with lokicli serve --stop.")
+    else:
+        LokiDaemon(args.idle_timeout).serve()
+
 def main():
     try:
         logfile_path = LokiConfig.get_file_path('lokicli.log')
         logging.basicConfig(filename=logfile_path, filemode='a', format='%(asctime)s %(levelname)s - %(message)s', level=logging.INFO)
-        loki = LokiCLI()
+        if hasattr(signal, "SIGPIPE"):
+            # let `lokicli logs ... | head` end quietly once head has what it needs
+            signal.signal(signal.SIGPIPE, signal.SIG_DFL)
 
-        parser = argparse.ArgumentParser(description="Loki CLI")
-        subparsers = parser.add_subparsers(dest="command", help="Available commands")
-        Subparsers(subparsers).create_parsers()
+        parser = get_parser()
         args = parser.parse_args()
+        if args.command == "logs" and not args.app and not args.from_store:
+            parser.error("the following arguments are required: --app/-a (unless --from-store is used)")
 
-        if args.command == "login":
-            loki.login(args.project)
-        elif args.command == "set":
-            loki.set_project(args.project)
-        elif args.command == "projects":
-            loki.list_projects()
-        elif args.command == "apps":
-            loki.list_apps(args.from_time, args.to_time, args.since, args.project)
-        elif args.command == "logs":
-            loki.get_logs(args.app, args.limit, args.from_time, args.to_time, args.since, args.query, args.project, args.invert_match, args.context, args.older_context, args.newer_context)
-        elif args.command == "version":
-            loki.get_version()
-        else:
-            parser.print_help()
+        if args.command == "serve":
+            return serve(args)
+        if args.command in ("logs", "apps"):
+            from .daemon import DaemonClient
+            if DaemonClient.can_forward(args) and DaemonClient().forward(sys.argv[1:]):
+                return
+
+        run_command(LokiCLI(), parser, args)
     except KeyboardInterrupt:
         print("\nExiting...")
+    except BrokenPipeError:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
     except Exception as e:
         print(f"Error: {e}")
 
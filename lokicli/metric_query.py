@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import io
+import re
+import csv
+import json
+import logging
+
+from .decoder import LogDecoder
+from .time_utils import LokiTimeUtils
+from .errors import QueryError
+
+AGGREGATIONS = {
+    ("count", False): "count_over_time",
+    ("count", True): "bytes_over_time",
+    ("rate", False): "rate",
+    ("rate", True): "bytes_rate",
+}
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+MAX_POINTS = 11000
+
+class MetricQuery:
+    def __init__(self, logReader, sink):
+        self.logReader = logReader
+        self.sink = sink
+
+    @staticmethod
+    def parse_step(step):
+        match = re.fullmatch(r"(\d+)([smhd])", step or "")
+        if not match:
+            raise ValueError("Invalid format for step. Specify value in seconds, minutes, hours or days eg: 30s, 5m, 1h or 1d.")
+        return int(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+
+    @staticmethod
+    def get_step(start_time, end_time, step):
+        span = (int(end_time) - int(start_time)) // 10**9
+        if not step:
+            # about 60 points, whatever the time range
+            return f"{max(1, span // 60)}s"
+
+        if span // MetricQuery.parse_step(step) > MAX_POINTS:
+            logging.error(f"Step {step} gives more than {MAX_POINTS} points for the time range.")
+            raise ValueError(f"Step {step} gives more than {MAX_POINTS} points for the time range. Please use a larger step.")
+        return step
+
+    @staticmethod
+    def build_query(log_query, kind, count_bytes, step, by):
+        grouping = f" by ({by})" if by else ""
+        return f"sum{grouping}({AGGREGATIONS[(kind, count_bytes)]}({log_query} [{step}]))"
+
+    def fetch(self, query, start_time, end_time, step):
+        params = {"query": query, "start": start_time, "end": end_time, "step": step}
+        try:
+            response = self.logReader.transport.get_api(f"{self.logReader.url}/loki/api/v1/query_range", params=params, timeout=60)
+
+            if response.status_code != 200:
+                logging.error(f"Error fetching metrics: {response.status_code}. Response: {response.text}")
+                raise QueryError(f"Error fetching metrics: {response.status_code}. Response: {response.text}")
+
+            return LogDecoder.loads(response.content)["data"]["result"]
+        except KeyboardInterrupt:
+            logging.error("Interrupted by user.")
+            raise KeyboardInterrupt
+        except Exception as e:
+            logging.error(f"Error fetching metrics: {e}")
+            raise e
+
+    @staticmethod
+    def get_series_name(metric):
+        return ",".join(f"{label}={value}" for label, value in sorted(metric.items())) or "total"
+
+    @staticmethod
+    def format_value(value):
+        return str(int(value)) if value == int(value) else f"{value:.3f}"
+
+    @staticmethod
+    def sparkline(values):
+        highest = max(values) if values else 0
+        if not highest:
+            return SPARK_CHARS[0] * len(values)
+        return "".join(SPARK_CHARS[min(len(SPARK_CHARS) - 1, int(value / highest * (len(SPARK_CHARS) - 1) + 0.5))] for value in values)
+
+    def get_table(self, result):
+        timestamps = sorted({int(point[0]) for series in result for point in series["values"]})
+        names = [self.get_series_name(series["metric"]) for series in result]
+        columns = [{int(point[0]): float(point[1]) for point in series["values"]} for series in result]
+        rows = [[LokiTimeUtils.unix_nanosecond_epoch_to_utc(timestamp * 10**9)] + [column.get(timestamp, 0.0) for column in columns] for timestamp in timestamps]
+        return names, rows
+
+    def render_table(self, result):
+        names, rows = self.get_table(result)
+        if not rows:
+            self.sink.write_lines(["No data points for the specified time range."])
+            return
+
+        widths = [20] + [max(len(name), 8) for name in names]
+        lines = ["  ".join(["time".ljust(widths[0])] + [name.rjust(width) for name, width in zip(names, widths[1:])])]
+        for row in rows:
+            lines.append("  ".join([row[0].ljust(widths[0])] + [self.format_value(value).rjust(width) for value, width in zip(row[1:], widths[1:])]))
+
+        lines.append("")
+        for index, name in enumerate(names):
+            values = [row[index + 1] for row in rows]
+            lines.append(f"{name}  {self.sparkline(values)}  total={self.format_value(sum(values))} max={self.format_value(max(values))}")
+        self.sink.write_lines(lines)
+
+    def render_csv(self, result):
+        names, rows = self.get_table(result)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(["time"] + names)
+        writer.writerows([row[0]] + [self.format_value(value) for value in row[1:]] for row in rows)
+        self.sink.write(buffer.getvalue())
+
+    def render_json(self, result):
+        series = [{"metric": item["metric"], "values": [[LokiTimeUtils.unix_nanosecond_epoch_to_utc(int(point[0]) * 10**9), float(point[1])] for point in item["values"]]} for item in result]
+        self.sink.write_lines([json.dumps(series)])
+
+    def run(self, log_query, kind, count_bytes, start_time, end_time, step, by, output):
+        try:
+            step = self.get_step(start_time, end_time, step)
+            result = self.fetch(self.build_query(log_query, kind, count_bytes, step, by), start_time, end_time, step)
+            {"table": self.render_table, "csv": self.render_csv, "json": self.render_json}[output](result)
+        except Exception as e:
+            logging.error(f"Error running metric query: {e}")
+            raise e
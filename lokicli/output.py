@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import sys
+import logging
+
+class OutputSink:
+    def __init__(self, stream=None, color=None, encoding="utf-8"):
+        if stream is None:
+            # anything printed before the sink takes over stdout has to come out first
+            sys.stdout.flush()
+            stream = sys.stdout.buffer
+
+        self.stream = stream
+        self.encoding = encoding
+        interactive = stream.isatty() if hasattr(stream, "isatty") else False
+        self.color = interactive if color is None else color
+        self.buffer_size = 8 * 1024 if interactive else 1024 * 1024
+        self.parts = []
+        self.buffered = 0
+        self.owns_stream = False
+
+        if self.color and sys.platform == "win32":
+            import colorama
+            if hasattr(colorama, "just_fix_windows_console"):
+                colorama.just_fix_windows_console()
+            else:
+                colorama.init()
+
+    @classmethod
+    def open(cls, path):
+        sink = cls(open(path, "wb"), color=False)
+        sink.owns_stream = True
+        return sink
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.owns_stream:
+                self.stream.close()
+
+    def write(self, text):
+        self.parts.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def write_lines(self, lines):
+        parts = self.parts
+        for line in lines:
+            parts.append(line)
+            parts.append("\n")
+            self.buffered += len(line) + 1
+            if self.buffered >= self.buffer_size:
+                self.flush()
+                parts = self.parts
+
+    def flush(self):
+        try:
+            if self.parts:
+                self.stream.write("".join(self.parts).encode(self.encoding, "replace"))
+                self.parts = []
+                self.buffered = 0
+            self.stream.flush()
+        except BrokenPipeError:
+            self.parts = []
+            self.buffered = 0
+            raise
+        except Exception as e:
+            logging.error(f"Error writing output: {e}")
+            raise e
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .errors import InvalidArgumentError
+
+_SHARD_DONE = object()
+
+class ParallelFetcher:
+    # pages an older shard fetches ahead while the newer shards are printed, keeps memory bounded by
+    # the shard count instead of the limit, a shard with more pages than this waits for its turn
+    PREFETCH_PAGES = 4
+
+    def __init__(self, logReader, parallelism):
+        if parallelism < 1 or parallelism > 32:
+            logging.error("Parallelism must be between 1 and 32.")
+            raise InvalidArgumentError("Parallelism must be between 1 and 32.")
+
+        self.logReader = logReader
+        self.parallelism = parallelism
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _split_evenly(start_time, end_time, shard_count):
+        span = end_time - start_time
+        shard_count = max(1, min(shard_count, span))
+        return [start_time + (span * i) // shard_count for i in range(shard_count + 1)]
+
+    @classmethod
+    def _split_pieces(cls, boundaries, shard_count):
+        # every piece keeps at least one shard, the rest go one at a time to the piece with the widest shards
+        spans = [boundaries[i + 1] - boundaries[i] for i in range(len(boundaries) - 1)]
+        counts = [1] * len(spans)
+        for _ in range(shard_count - len(spans)):
+            index = max(range(len(spans)), key=lambda i: spans[i] / counts[i])
+            counts[index] += 1
+
+        split = [boundaries[0]]
+        for i, count in enumerate(counts):
+            split += cls._split_evenly(boundaries[i], boundaries[i + 1], count)[1:]
+        return split
+
+    def split_window(self, start_time, end_time):
+        result_cache = self.logReader.result_cache
+        closed_end = min(max(result_cache.get_closed_end(), start_time), end_time) if result_cache is not None else start_time
+        shard_count = max(1, min(self.parallelism, end_time - start_time))
+
+        if closed_end == start_time or shard_count == 1:
+            boundaries = self._split_evenly(start_time, end_time, shard_count)
+        else:
+            # shards in the cacheable part end on chunk boundaries so no chunk is split between two shards and
+            # left uncached, that part gets at most one shard per chunk and the recent part is split evenly
+            first_boundary = -(-start_time // result_cache.chunk) * result_cache.chunk
+            points = [start_time] + [boundary for boundary in range(first_boundary, closed_end, result_cache.chunk) if boundary > start_time] + [closed_end]
+            pieces = len(points) - 1
+
+            open_shards = 0
+            if closed_end < end_time:
+                open_shards = min(shard_count - 1, max(1, round(shard_count * (end_time - closed_end) / (end_time - start_time))))
+            closed_shards = min(shard_count - open_shards, pieces)
+            if closed_end < end_time:
+                open_shards = shard_count - closed_shards
+
+            boundaries = [points[(pieces * i) // closed_shards] for i in range(closed_shards + 1)]
+            if open_shards:
+                boundaries += self._split_evenly(closed_end, end_time, open_shards)[1:]
+            if len(boundaries) - 1 < shard_count:
+                # a window with fewer chunks than shards, the split chunks are fetched without the cache
+                boundaries = self._split_pieces(boundaries, shard_count)
+
+        # loki returns logs backwards in time, so the newest shard comes first
+        return [(boundaries[i], boundaries[i + 1]) for i in reversed(range(len(boundaries) - 1))]
+
+    @staticmethod
+    def _put(pages, item, stop_event):
+        while not stop_event.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _is_covered(self, fetched, shard, limit):
+        # lines of newer shards are printed first, once they and this shard's own lines cover the
+        # limit nothing this shard fetches next can be printed
+        with self.lock:
+            return sum(fetched[:shard + 1]) >= limit
+
+    def _fetch_shard(self, shard, shard_start, shard_end, limit, query, pages, fetched, stop_event):
+        try:
+            for page in self.logReader.iter_pages(shard_start, shard_end, limit, query):
+                with self.lock:
+                    fetched[shard] += len(page)
+                if not self._put(pages, page, stop_event) or self._is_covered(fetched, shard, limit):
+                    return
+        except BaseException as e:
+            logging.error(f"Error fetching shard {shard_start}-{shard_end}: {e}")
+            self._put(pages, e, stop_event)
+        finally:
+            self._put(pages, _SHARD_DONE, stop_event)
+
+    def iter_pages(self, start_time, end_time, limit, query):
+        if self.parallelism == 1:
+            yield from self.logReader.iter_pages(start_time, end_time, limit, query)
+            return
+
+        shards = self.split_window(int(start_time), int(end_time))
+        shard_queues = [queue.Queue(maxsize=self.PREFETCH_PAGES) for _ in shards]
+        # every call has its own stop event and line counts, so a fetcher can be iterated again
+        fetched = [0] * len(shards)
+        stop_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=len(shards))
+
+        try:
+            for shard, ((shard_start, shard_end), pages) in enumerate(zip(shards, shard_queues)):
+                executor.submit(self._fetch_shard, shard, shard_start, shard_end, limit, query, pages, fetched, stop_event)
+
+            for pages in shard_queues:
+                while limit > 0:
+                    page = pages.get()
+                    if page is _SHARD_DONE:
+                        break
+                    if isinstance(page, BaseException):
+                        raise page
+
+                    page = page[:limit]
+                    limit = limit - len(page)
+                    yield page
+
+                if limit <= 0:
+                    break
+        finally:
+            stop_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import logging
+
+REGEX_METACHARACTERS = set(".^$*+?()[]{}|")
+
+class QueryPlanner:
+    def __init__(self, queries, invert_match=False, pipeline=None):
+        self.queries = [query for query in (queries or []) if query]
+        self.invert_match = invert_match
+        self.pipeline = pipeline.strip() if pipeline else ""
+
+    @staticmethod
+    def as_literal(query):
+        # a query without regex operators matches exactly like a plain substring search,
+        # escaped punctuation such as \\. or \\/ is unescaped
+        literal = []
+        i = 0
+        while i < len(query):
+            char = query[i]
+            if char == "\\":
+                if i + 1 < len(query) and not query[i + 1].isalnum():
+                    literal.append(query[i + 1])
+                    i += 2
+                    continue
+                return None
+            if char in REGEX_METACHARACTERS:
+                return None
+            literal.append(char)
+            i += 1
+        return "".join(literal)
+
+    @staticmethod
+    def split_alternation(query):
+        if "(" in query or "[" in query:
+            return None
+
+        parts, part, i = [], [], 0
+        while i < len(query):
+            if query[i] == "\\":
+                part.append(query[i:i + 2])
+                i += 2
+                continue
+            if query[i] == "|":
+                parts.append("".join(part))
+                part = []
+            else:
+                part.append(query[i])
+            i += 1
+        parts.append("".join(part))
+
+        literals = [QueryPlanner.as_literal(part) for part in parts]
+        if len(literals) < 2 or any(not literal for literal in literals):
+            return None
+        return literals
+
+    @staticmethod
+    def quote(value):
+        if "`" not in value:
+            return f"`{value}`"
+        return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+    def _plan_filter(self, query):
+        literal = self.as_literal(query)
+        if literal:
+            return f"{'!=' if self.invert_match else '|='} {self.quote(literal)}"
+
+        # "a|b" with -i is the same as != a != b, without -i chaining would AND the literals so the regex stays
+        alternatives = self.split_alternation(query) if self.invert_match else None
+        if alternatives:
+            return " ".join(f"!= {self.quote(literal)}" for literal in alternatives)
+
+        return f"{'!~' if self.invert_match else '|~'} {self.quote(query)}"
+
+    def get_pipeline(self):
+        try:
+            stages = [self._plan_filter(query) for query in self.queries]
+            if self.pipeline:
+                stages.append(self.pipeline if self.pipeline.startswith("|") else "| " + self.pipeline)
+            return "".join(" " + stage for stage in stages)
+        except Exception as e:
+            logging.error(f"Error planning query: {e}")
+            raise e
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import io
+import csv
+import json
+import logging
+import itertools
+
+from .time_utils import LokiTimeUtils
+
+OUTPUT_FORMATS = ["text", "ndjson", "csv", "parquet"]
+
+class RecordWriter:
+    def __init__(self, output, sink, path=None, show_labels=None, with_source=False, batch_size=5000):
+        # pyarrow takes a while to import, so it is only loaded when parquet is asked for
+        self.pyarrow = self._import_pyarrow() if output == "parquet" else None
+        if output == "parquet" and self.pyarrow is None:
+            logging.error("Parquet output needs pyarrow.")
+            raise ValueError("Parquet output needs pyarrow, install it with: pip install pyarrow")
+        if output == "parquet" and not path:
+            logging.error("Parquet output needs a file.")
+            raise ValueError("Parquet output needs a file, please specify it with --out.")
+
+        self.output = output
+        self.sink = sink
+        self.path = path
+        self.show_labels = show_labels or []
+        self.with_source = with_source
+        self.batch_size = batch_size
+        self.parquet_writer = None
+        self.columns = (["source"] if with_source else []) + ["time", "timestamp"] + self.show_labels + ["labels", "line"]
+
+    @staticmethod
+    def _import_pyarrow():
+        try:
+            import pyarrow
+            import pyarrow.parquet
+            return pyarrow
+        except ImportError:
+            return None
+
+    def _write_ndjson(self, page, times):
+        lines = []
+        for item, utc_time in zip(page, times):
+            record = {"source": item.source} if self.with_source else {}
+            record.update({"time": utc_time, "timestamp": str(item.timestamp), "labels": item.labels, "line": item.line})
+            lines.append(json.dumps(record, ensure_ascii=False))
+        self.sink.write_lines(lines)
+
+    def _write_csv(self, page, times):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for item, utc_time in zip(page, times):
+            labels = item.labels
+            row = [item.source or ""] if self.with_source else []
+            row += [utc_time, item.timestamp] + [labels.get(label, "") for label in self.show_labels]
+            row += [json.dumps(labels, sort_keys=True), item.line]
+            writer.writerow(row)
+        self.sink.write(buffer.getvalue())
+
+    def _get_parquet_schema(self):
+        fields = [("source", self.pyarrow.string())] if self.with_source else []
+        fields.append(("time", self.pyarrow.timestamp("ns", tz="UTC")))
+        fields += [(label, self.pyarrow.string()) for label in self.show_labels]
+        fields += [("labels", self.pyarrow.map_(self.pyarrow.string(), self.pyarrow.string())), ("line", self.pyarrow.string())]
+        return self.pyarrow.schema(fields)
+
+    def _write_parquet(self, page, times):
+        columns = {"source": [item.source for item in page]} if self.with_source else {}
+        columns["time"] = [item.timestamp for item in page]
+        for label in self.show_labels:
+            columns[label] = [item.labels.get(label) for item in page]
+        columns["labels"] = [list(item.labels.items()) for item in page]
+        columns["line"] = [item.line for item in page]
+        self.parquet_writer.write_table(self.pyarrow.Table.from_pydict(columns, schema=self.parquet_writer.schema))
+
+    def write_header(self):
+        if self.output == "csv":
+            self.sink.write(",".join(self.columns) + "\n")
+        if self.output == "parquet":
+            self.parquet_writer = self.pyarrow.parquet.ParquetWriter(self.path, self._get_parquet_schema(), compression="zstd")
+
+    def write(self, logs):
+        try:
+            self.write_header()
+            write_page = {"ndjson": self._write_ndjson, "csv": self._write_csv, "parquet": self._write_parquet}[self.output]
+
+            logs = iter(logs)
+            while True:
+                page = list(itertools.islice(logs, self.batch_size))
+                if not page:
+                    break
+                # parquet keeps the integer timestamps, the text formats get them formatted once per page
+                times = None if self.output == "parquet" else LokiTimeUtils.unix_nanosecond_epochs_to_rfc3339([item.timestamp for item in page])
+                write_page(page, times)
+        except Exception as e:
+            logging.error(f"Error writing {self.output} records: {e}")
+            raise e
+        finally:
+            if self.parquet_writer is not None:
+                self.parquet_writer.close()
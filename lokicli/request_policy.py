@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+RETRY_STATUSES = {429, 502, 503, 504}
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class RequestPolicy:
+    def __init__(self, max_retries=5, base_delay=0.5, max_delay=30, rate=20, burst=40, max_in_flight=16):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def _get_host_limits(self, url):
+        # every project has its own gateway host, so the limits apply per project
+        host = urlparse(url).hostname
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = (TokenBucket(self.rate, self.burst), threading.BoundedSemaphore(self.max_in_flight))
+            return self.hosts[host]
+
+    def get_backoff(self, attempt):
+        # full jitter keeps parallel shards that failed together from retrying together
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def get_retry_after(self, response):
+        retry_after = response.headers.get("Retry-After")
+        if not retry_after:
+            return None
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        return min(max(delay, 0), self.max_delay)
+
+    def send(self, url, request):
+        bucket, in_flight = self._get_host_limits(url)
+
+        for attempt in range(self.max_retries + 1):
+            bucket.acquire()
+            try:
+                with in_flight:
+                    response = request()
+            except requests.exceptions.ConnectionError as e:
+                # read timeouts are not retried here, the caller decides whether to split the query
+                if attempt == self.max_retries:
+                    raise
+                delay = self.get_backoff(attempt)
+                logging.warning(f"Connection error on {urlparse(url).path}, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                return response
+
+            delay = self.get_retry_after(response)
+            delay = self.get_backoff(attempt) if delay is None else delay
+            response.close()
+            logging.warning(f"Got {response.status_code} on {urlparse(url).path}, retrying in {delay:.1f}s (attempt {attempt + 1} of {self.max_retries}).")
+            time.sleep(delay)
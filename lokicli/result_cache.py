@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import zlib
+import hashlib
+import logging
+import tempfile
+
+from .config import LokiConfig
+from .decoder import LogDecoder
+from .log_record import LogRecord
+
+class ResultCache:
+    def __init__(self, project, chunk_seconds, closed_after_seconds, max_size_mb):
+        self.project = project
+        self.chunk = int(chunk_seconds) * 10**9
+        self.closed_after = int(closed_after_seconds) * 10**9
+        self.max_size = int(max_size_mb) * 1024 * 1024
+        self.CACHE_DIR = LokiConfig.get_file_path('cache')
+        os.makedirs(self.CACHE_DIR, exist_ok=True)
+
+    def align(self, timestamp):
+        return timestamp - timestamp % self.chunk
+
+    def get_closed_end(self, now=None):
+        # chunks that end at or before this are cacheable
+        return self.align((now or time.time_ns()) - self.closed_after)
+
+    def split_window(self, start_time, end_time, now=None):
+        # cuts the window into chunks aligned to the chunk size, only chunks that ended long enough
+        # ago to have all their lines ingested are cached, the rest is merged into uncached segments
+        closed_before = (now or time.time_ns()) - self.closed_after
+        first_boundary = -(-start_time // self.chunk) * self.chunk
+        last_boundary = self.align(end_time)
+
+        if last_boundary <= first_boundary:
+            return [(start_time, end_time, False)]
+
+        segments = [(start_time, first_boundary, False)] if start_time < first_boundary else []
+        segments += [(chunk_start, chunk_start + self.chunk, chunk_start + self.chunk <= closed_before) for chunk_start in range(first_boundary, last_boundary, self.chunk)]
+        if last_boundary < end_time:
+            segments.append((last_boundary, end_time, False))
+
+        merged = []
+        for segment in segments:
+            if merged and not merged[-1][2] and not segment[2]:
+                merged[-1] = (merged[-1][0], segment[1], False)
+            else:
+                merged.append(segment)
+
+        # loki returns logs backwards in time, so the newest segment comes first
+        return list(reversed(merged))
+
+    def _get_path(self, query, start_time, end_time):
+        key = f"{self.project}\0{query}\0{start_time}\0{end_time}"
+        return os.path.join(self.CACHE_DIR, hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + ".json.z")
+
+    @staticmethod
+    def _encode(lines, cursor):
+        streams, stream_index, rows = [], {}, []
+        for item in lines:
+            # the decoder shares one labels dict between all lines of a stream
+            index = stream_index.get(id(item.labels))
+            if index is None:
+                index = stream_index[id(item.labels)] = len(streams)
+                streams.append(item.labels)
+            rows.append([item.timestamp, index, item.line])
+        return zlib.compress(json.dumps({"streams": streams, "lines": rows, "cursor": cursor}).encode(), 6)
+
+    @staticmethod
+    def _decode(data):
+        entry = LogDecoder.loads(zlib.decompress(data))
+        streams = entry["streams"]
+        # chunks saved before timestamps were parsed once hold them as strings
+        lines = [LogRecord(int(timestamp), log, streams[index]) for timestamp, index, log in entry["lines"]]
+        return lines, entry["cursor"]
+
+    def load(self, query, start_time, end_time):
+        path = self._get_path(query, start_time, end_time)
+        try:
+            with open(path, "rb") as file:
+                entry = self._decode(file.read())
+            # the mtime is the recency the eviction goes by
+            os.utime(path)
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f"Error loading cached logs {path}: {e}")
+            return None
+
+    def save(self, query, start_time, end_time, lines, cursor):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.CACHE_DIR, prefix=".chunk-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(self._encode(lines, cursor))
+                os.replace(tmp_path, self._get_path(query, start_time, end_time))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self.evict()
+        except Exception as e:
+            # the chunk is fetched from loki again next time
+            logging.error(f"Error saving cached logs: {e}")
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.CACHE_DIR):
+            if entry.name.endswith(".json.z"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
@@ -1,5 +1,6 @@
 import logging
 from .config import LokiConfig
+from .record_writer import OUTPUT_FORMATS
 
 class Subparsers:
     def __init__(self, subparsers):
@@ -8,8 +9,9 @@ class Subparsers:
         try:
             properties = LokiConfig().get_properties()
             self.defaultLimit = int(properties['logReader']['defaultLimit'])
+            self.defaultParallelism = int(properties['logReader']['parallelism'])
         except Exception as e:
-            logging.error(f"Error getting default limit: {e}")
+            logging.error(f"Error getting default limit and parallelism: {e}")
             raise e
 
     def _create_set_project_parser(self):
@@ -77,17 +79,24 @@ class Subparsers:
     def _create_get_logs_parser(self):
         try:
             get_logs_parser = self.subparsers.add_parser("logs", help="Get logs for an app in a certain time period [default = last 1 hour]  (Use -h for help)")
-            get_logs_parser.add_argument("--app", "-a", required=True, help="[REQUIRED] App name to retrieve logs for, eg: metro-default-prod")
+            get_logs_parser.add_argument("--app", "-a", nargs="+", help="[REQUIRED] App names or glob patterns to retrieve logs for, eg: metro-default-prod 'api-*-prod' (not needed with --from-store)")
             get_logs_parser.add_argument("--limit", "-l", type=int, default=self.defaultLimit, help="[OPTIONAL] Limit the number of logs to fetch (default=1000, max=500000)")
             get_logs_parser.add_argument("--from_time", "-f", help="From date and time (format, eg: 2024-01-22T10:30:00Z)")
             get_logs_parser.add_argument("--to_time", "-t", help="To date and time (format, eg: 2024-01-22T12:30:00Z)")
             get_logs_parser.add_argument("--since", "-s", default="1h", help="Since (format, eg: 30m, 1h, 24h) [default=1h]")
-            get_logs_parser.add_argument("--query", "-q", help="[OPTIONAL] Query string to filter logs (can be regex as well).")
-            get_logs_parser.add_argument("--project", "-p", help="[OPTIONAL] Project in which your app belongs (s2s/ao3)")
+            get_logs_parser.add_argument("--query", "-q", action="append", help="[OPTIONAL] Query string to filter logs (can be regex as well). Repeat it to only keep lines matching every query.")
+            get_logs_parser.add_argument("--pipeline", help="[OPTIONAL] LogQL stages run by Loki after the query filters, eg: '| json | level=\"error\"'")
+            get_logs_parser.add_argument("--project", "-p", help="[OPTIONAL] Project in which your app belongs (s2s/ao3), or comma separated projects to query together without changing the set project")
             get_logs_parser.add_argument("--invert-match", "-i", help="[OPTIONAL] Show non-matching log lines for a particular query. Use with --query", action="store_true")
             get_logs_parser.add_argument("--context", "-c", help="[OPTIONAL] Show context for a particular query. Use with --query. (eg: --context 5) this prints 5 lines before and after the matched line", type=int)
             get_logs_parser.add_argument("--older-context", "-o", help="[OPTIONAL] Show older context for a particular query. Use with --query. (eg: --older-context 5) this prints 5 lines before the matched line", type=int)
             get_logs_parser.add_argument("--newer-context", "-n", help="[OPTIONAL] Show newer context for a particular query. Use with --query. (eg: --newer-context 5) this prints 5 lines after the matched line", type=int)
+            get_logs_parser.add_argument("--parallel", "-j", type=int, default=self.defaultParallelism, help=f"[OPTIONAL] Number of time shards to fetch concurrently (default={self.defaultParallelism}, max=32)")
+            get_logs_parser.add_argument("--show-labels", help="[OPTIONAL] Comma separated stream labels to print in front of every log line, eg: pod,container")
+            get_logs_parser.add_argument("--no-cache", action="store_true", help="[OPTIONAL] Fetch every page from loki instead of reading closed time windows from the local cache")
+            get_logs_parser.add_argument("--from-store", metavar="DIR", help="[OPTIONAL] Query the logs saved by lokicli fetch --into DIR locally instead of querying loki")
+            get_logs_parser.add_argument("--output", "-O", choices=OUTPUT_FORMATS, default="text", help="[OPTIONAL] Output format, ndjson/csv/parquet include the timestamp and labels of every line (default=text, parquet needs pyarrow)")
+            get_logs_parser.add_argument("--out", help="[OPTIONAL] File to write the output to instead of stdout (required for parquet)")
 
             get_logs_parser.usage = """
             (Either specify from_time and to_time or specify since, default = last 1 hour)
@@ -104,6 +113,134 @@ class Subparsers:
             lokicli logs -a sms-ring-prod -c 5 -q '\\d{4}-\\d{2}-\\d{2}'      # Get context on the logs for the specified app that match the query
             lokicli logs -a sms-ring-prod -o 5 -q '\\d{4}-\\d{2}-\\d{2}'      # Get older context on the logs for the specified app that match the query
             lokicli logs -a sms-ring-prod -n 5 -q '\\d{4}-\\d{2}-\\d{2}'      # Get newer context on the logs for the specified app that match the query
+            lokicli logs -a metro-default-prod --since 24h -l 500000 -j 8   # Fetch 8 time shards of the last 24 hours concurrently
+            lokicli logs -a metro-default-prod --show-labels pod,container    # Prefix every log line with the pod and container it came from
+            lokicli logs -a metro-default-prod -q Error -q order-1234       # Get logs that match both queries
+            lokicli logs -a metro-default-prod --pipeline '| json | level="error"'   # Get logs that loki parses as json with level error
+            lokicli logs -a metro-default-prod 'api-*-prod' -q Error          # Get logs of several apps merged by timestamp
+            lokicli logs -a 'checkout-*' -p s2s,ao3,s2s-use1                  # Get logs of the matching apps across projects
+            lokicli logs -a metro-default-prod -f 2024-01-22T10:00:00Z -t 2024-01-22T12:00:00Z --no-cache   # Skip the local cache of past time windows
+            lokicli logs --from-store ./incident -q Error -c 5  # Query logs saved with lokicli fetch without calling loki
+            lokicli logs -a metro-default-prod -O ndjson > logs.ndjson          # Get logs with their timestamp and labels as json lines
+            lokicli logs -a metro-default-prod -l 100000 -O parquet --out logs.parquet   # Get logs as a parquet file for pandas or DuckDB
+            """
+        except Exception as e:
+            raise e
+
+    def _create_fetch_logs_parser(self):
+        try:
+            fetch_logs_parser = self.subparsers.add_parser("fetch", help="Save the logs of an app in a time period to a local store to query them offline (Use -h for help)")
+            fetch_logs_parser.add_argument("--app", "-a", required=True, help="[REQUIRED] App name to save logs for, eg: metro-default-prod")
+            fetch_logs_parser.add_argument("--into", required=True, metavar="DIR", help="[REQUIRED] Directory to save the log store in, an existing store is replaced")
+            fetch_logs_parser.add_argument("--limit", "-l", type=int, default=1000000, help="[OPTIONAL] Limit the number of logs to save (default=1000000, max=5000000)")
+            fetch_logs_parser.add_argument("--from_time", "-f", help="From date and time (format, eg: 2024-01-22T10:30:00Z)")
+            fetch_logs_parser.add_argument("--to_time", "-t", help="To date and time (format, eg: 2024-01-22T12:30:00Z)")
+            fetch_logs_parser.add_argument("--since", "-s", default="1h", help="Since (format, eg: 30m, 1h, 24h) [default=1h]")
+            fetch_logs_parser.add_argument("--project", "-p", help="[OPTIONAL] Project in which your app belongs (s2s/ao3)")
+            fetch_logs_parser.add_argument("--parallel", "-j", type=int, default=self.defaultParallelism, help=f"[OPTIONAL] Number of time shards to fetch concurrently (default={self.defaultParallelism}, max=32)")
+            fetch_logs_parser.add_argument("--no-cache", action="store_true", help="[OPTIONAL] Fetch every page from loki instead of reading closed time windows from the local cache")
+
+            fetch_logs_parser.usage = """
+            (Either specify from_time and to_time or specify since, default = last 1 hour)
+
+            lokicli fetch -a metro-default-prod -s 6h --into ./incident -j 8    # Save the last 6 hours of logs in ./incident
+            lokicli logs --from-store ./incident -q Error -c 5                  # Then query them locally, as often as needed
+            lokicli logs --from-store ./incident -i -q healthcheck -l 5000
+            """
+        except Exception as e:
+            raise e
+
+    def _create_export_logs_parser(self):
+        try:
+            export_logs_parser = self.subparsers.add_parser("export", help="Write the logs of an app to an NDJSON file that can be resumed when interrupted (Use -h for help)")
+            export_logs_parser.add_argument("--app", "-a", required=True, help="[REQUIRED] App name to export logs for, eg: metro-default-prod")
+            export_logs_parser.add_argument("--out", required=True, help="[REQUIRED] File to write the logs to as NDJSON, gzip compressed if it ends with .gz")
+            export_logs_parser.add_argument("--resume", action="store_true", help="[OPTIONAL] Continue an interrupted export of the same app and query from its checkpoint")
+            export_logs_parser.add_argument("--limit", "-l", type=int, default=1000000, help="[OPTIONAL] Limit the number of logs to export (default=1000000, max=5000000)")
+            export_logs_parser.add_argument("--from_time", "-f", help="From date and time (format, eg: 2024-01-22T10:30:00Z)")
+            export_logs_parser.add_argument("--to_time", "-t", help="To date and time (format, eg: 2024-01-22T12:30:00Z)")
+            export_logs_parser.add_argument("--since", "-s", default="1h", help="Since (format, eg: 30m, 1h, 24h) [default=1h]")
+            export_logs_parser.add_argument("--query", "-q", action="append", help="[OPTIONAL] Query string to filter logs (can be regex as well). Repeat it to only keep lines matching every query.")
+            export_logs_parser.add_argument("--pipeline", help="[OPTIONAL] LogQL stages run by Loki after the query filters, eg: '| json | level=\"error\"'")
+            export_logs_parser.add_argument("--project", "-p", help="[OPTIONAL] Project in which your app belongs (s2s/ao3)")
+            export_logs_parser.add_argument("--invert-match", "-i", help="[OPTIONAL] Export non-matching log lines for a particular query. Use with --query", action="store_true")
+
+            export_logs_parser.usage = """
+            (Either specify from_time and to_time or specify since, default = last 1 hour)
+
+            lokicli export -a metro-default-prod -f 2024-01-22T00:00:00Z -t 2024-01-23T00:00:00Z --out metro.ndjson.gz   # Export a day of logs
+            lokicli export -a metro-default-prod -f 2024-01-22T00:00:00Z -t 2024-01-23T00:00:00Z --out metro.ndjson.gz --resume   # Continue it after an interruption
+            """
+        except Exception as e:
+            raise e
+
+    def _create_tail_logs_parser(self):
+        try:
+            tail_logs_parser = self.subparsers.add_parser("tail", help="Follow the logs of an app as they arrive (Use -h for help)")
+            tail_logs_parser.add_argument("--app", "-a", required=True, help="[REQUIRED] App name to follow logs for, eg: metro-default-prod")
+            tail_logs_parser.add_argument("--since", "-s", default="1m", help="Start with the logs of this lookback period (format, eg: 5m, 1h) [default=1m]")
+            tail_logs_parser.add_argument("--query", "-q", action="append", help="[OPTIONAL] Query string to filter logs (can be regex as well). Repeat it to only keep lines matching every query.")
+            tail_logs_parser.add_argument("--pipeline", help="[OPTIONAL] LogQL stages run by Loki after the query filters, eg: '| json | level=\"error\"'")
+            tail_logs_parser.add_argument("--project", "-p", help="[OPTIONAL] Project in which your app belongs (s2s/ao3)")
+            tail_logs_parser.add_argument("--invert-match", "-i", help="[OPTIONAL] Show non-matching log lines for a particular query. Use with --query", action="store_true")
+            tail_logs_parser.add_argument("--show-labels", help="[OPTIONAL] Comma separated stream labels to print in front of every log line, eg: pod,container")
+            tail_logs_parser.add_argument("--delay-for", type=int, default=0, help="[OPTIONAL] Seconds to wait for late log lines before printing them (max=5, default=0)")
+            tail_logs_parser.add_argument("--poll", action="store_true", help="[OPTIONAL] Poll query_range instead of using the tail websocket")
+            tail_logs_parser.add_argument("--poll-interval", type=float, default=2, help="[OPTIONAL] Seconds between polls when polling (default=2)")
+
+            tail_logs_parser.usage = """
+            lokicli tail -a metro-default-prod                   # Follow the logs of the app, starting with the last minute
+            lokicli tail -a metro-default-prod -s 10m -q Error   # Follow the lines matching the query, starting with the last 10 minutes
+            lokicli tail -a metro-default-prod -i -q healthcheck # Follow the lines that do not match the query
+            lokicli tail -a metro-default-prod --poll            # Poll for new lines when the proxy blocks websockets
+            """
+        except Exception as e:
+            raise e
+
+    def _add_metric_arguments(self, metric_parser):
+        metric_parser.add_argument("--app", "-a", required=True, help="[REQUIRED] App name to aggregate logs for, eg: metro-default-prod")
+        metric_parser.add_argument("--from_time", "-f", help="From date and time (format, eg: 2024-01-22T10:30:00Z)")
+        metric_parser.add_argument("--to_time", "-t", help="To date and time (format, eg: 2024-01-22T12:30:00Z)")
+        metric_parser.add_argument("--since", "-s", default="1h", help="Since (format, eg: 30m, 1h, 24h) [default=1h]")
+        metric_parser.add_argument("--query", "-q", action="append", help="[OPTIONAL] Query string to filter logs (can be regex as well). Repeat it to only keep lines matching every query.")
+        metric_parser.add_argument("--pipeline", help="[OPTIONAL] LogQL stages run by Loki after the query filters, eg: '| json | level=\"error\"'")
+        metric_parser.add_argument("--project", "-p", help="[OPTIONAL] Project in which your app belongs (s2s/ao3)")
+        metric_parser.add_argument("--invert-match", "-i", help="[OPTIONAL] Aggregate non-matching log lines for a particular query. Use with --query", action="store_true")
+        metric_parser.add_argument("--step", help="[OPTIONAL] Width of every data point (format, eg: 30s, 5m, 1h) [default=about 60 points over the time range]")
+        metric_parser.add_argument("--by", help="[OPTIONAL] Comma separated stream labels to split the result by, eg: pod")
+        metric_parser.add_argument("--bytes", action="store_true", help="[OPTIONAL] Aggregate the size of the log lines in bytes instead of the number of lines")
+        metric_parser.add_argument("--output", "-O", choices=["table", "csv", "json"], default="table", help="[OPTIONAL] Output format (default=table)")
+
+    def _create_metric_parsers(self):
+        try:
+            count_parser = self.subparsers.add_parser("count", help="Count the log lines of an app per time step, aggregated by Loki (Use -h for help)")
+            self._add_metric_arguments(count_parser)
+            count_parser.usage = """
+            lokicli count -a metro-default-prod -q Error             # Number of lines matching the query in every step of the last hour
+            lokicli count -a metro-default-prod -s 24h --step 1h     # Number of lines per hour over the last day
+            lokicli count -a metro-default-prod --by pod -O csv      # Number of lines per pod as csv
+            lokicli count -a metro-default-prod --bytes              # Size of the logs in bytes in every step
+            """
+
+            rate_parser = self.subparsers.add_parser("rate", help="Log lines per second of an app per time step, aggregated by Loki (Use -h for help)")
+            self._add_metric_arguments(rate_parser)
+            rate_parser.usage = """
+            lokicli rate -a metro-default-prod -q Error --step 5m    # Matching lines per second, averaged over every 5 minutes
+            lokicli rate -a metro-default-prod --bytes -O json       # Bytes logged per second as json
+            """
+        except Exception as e:
+            raise e
+
+    def _create_serve_parser(self):
+        try:
+            serve_parser = self.subparsers.add_parser("serve", help="Run a local daemon that keeps logins, connections and app maps warm for logs and apps (Use -h for help)")
+            serve_parser.add_argument("--idle-timeout", type=int, help="[OPTIONAL] Stop after this many seconds without requests [default=idleTimeoutSeconds in properties.ini]")
+            serve_parser.add_argument("--detach", "-d", action="store_true", help="[OPTIONAL] Start the daemon in the background and return")
+            serve_parser.add_argument("--stop", action="store_true", help="[OPTIONAL] Stop the running daemon")
+            serve_parser.usage = """
+            lokicli serve -d                                    # Start the daemon in the background, logs and apps are sent to it while it runs
+            lokicli serve --idle-timeout 600                    # Run the daemon in the foreground and stop after 10 minutes without requests
+            lokicli serve --stop                                # Stop the daemon
             """
         except Exception as e:
             raise e
@@ -114,6 +251,11 @@ class Subparsers:
             self._create_list_apps_parser()
             self._create_list_projects_parser()
             self._create_get_logs_parser()
+            self._create_fetch_logs_parser()
+            self._create_export_logs_parser()
+            self._create_tail_logs_parser()
+            self._create_metric_parsers()
+            self._create_serve_parser()
             self._login_parser()
             self._version_parser()
         except Exception as e:
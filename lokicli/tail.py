@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import time
+import logging
+from urllib.parse import urlencode
+
+from .decoder import LogDecoder
+from .log_cursor import LogCursor
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+class LogTailer:
+    def __init__(self, logReader, contextualLogs, access_token, regex_query, show_labels=None, delay_for=0, poll_interval=2, max_backoff=30):
+        self.logReader = logReader
+        self.contextualLogs = contextualLogs
+        self.access_token = access_token
+        self.regex_query = regex_query
+        self.show_labels = show_labels
+        self.delay_for = delay_for
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.last_timestamp = None
+        self.last_lines = set()
+        self.resuming = False
+
+        if delay_for < 0 or delay_for > 5:
+            logging.error("Delay for must be between 0 and 5 seconds.")
+            raise ValueError("Delay for must be between 0 and 5 seconds.")
+
+    @staticmethod
+    def _now():
+        return time.time_ns()
+
+    def _print(self, records):
+        if records:
+            self.contextualLogs.pretty_print(records, self.regex_query, self.show_labels)
+            self.contextualLogs.sink.flush()
+
+    def _remember(self, records):
+        for item in records:
+            timestamp = item.timestamp
+            if self.last_timestamp is None or timestamp > self.last_timestamp:
+                self.last_timestamp = timestamp
+                self.last_lines = set()
+            if timestamp == self.last_timestamp:
+                self.last_lines.add(LogCursor.line_hash(item))
+
+    def _filter_seen(self, records):
+        # after a reconnect loki replays from the last seen timestamp, drop what was already printed
+        if not self.resuming:
+            return records
+
+        new_records = []
+        for item in records:
+            timestamp = item.timestamp
+            if timestamp < self.last_timestamp or (timestamp == self.last_timestamp and LogCursor.line_hash(item) in self.last_lines):
+                continue
+            if timestamp > self.last_timestamp:
+                self.resuming = False
+            new_records.append(item)
+        return new_records
+
+    def _get_tail_url(self, query, start_time):
+        params = {"query": query, "start": start_time, "delay_for": self.delay_for, "limit": self.logReader.batch_controller.max_batch_size}
+        return self.logReader.url.replace("https://", "wss://", 1).replace("http://", "ws://", 1) + "/loki/api/v1/tail?" + urlencode(params)
+
+    def follow_websocket(self, query, start_time):
+        connected_once = False
+        backoff = 1
+
+        while True:
+            resume_time = self.last_timestamp if self.last_timestamp is not None else start_time
+            try:
+                connection = websocket.create_connection(self._get_tail_url(query, resume_time), cookie=f"_oauth2_proxy={self.access_token}", timeout=60)
+            except Exception as e:
+                if not connected_once:
+                    # most likely the proxy does not let the websocket upgrade through
+                    logging.error(f"Error opening tail websocket: {e}")
+                    return
+                logging.error(f"Error reconnecting tail websocket, retrying in {backoff}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            connected_once = True
+            backoff = 1
+            connection.settimeout(None)
+            try:
+                while True:
+                    message = LogDecoder.loads(connection.recv())
+                    if message.get("dropped_entries"):
+                        logging.warning(f"Loki dropped {len(message['dropped_entries'])} entries while tailing.")
+
+                    records = self._filter_seen(LogDecoder.decode_streams(message.get("streams") or [], "FORWARD"))
+                    self._print(records)
+                    self._remember(records)
+            except (KeyboardInterrupt, BrokenPipeError):
+                raise
+            except Exception as e:
+                logging.error(f"Tail websocket closed, resuming from {self.last_timestamp}: {e}")
+                self.resuming = self.last_timestamp is not None
+            finally:
+                connection.close()
+
+    def follow_polling(self, query, start_time):
+        cursor = LogCursor(start_time, self._now() - self.delay_for * 10**9, "FORWARD", self.logReader.batch_controller.max_batch_size)
+        if self.last_timestamp is not None:
+            cursor.seek(self.last_timestamp, self.last_lines)
+
+        while True:
+            try:
+                for records in self.logReader.iter_pages(None, None, 10**9, query, cursor):
+                    self._print(records)
+                    self._remember(records)
+            except (KeyboardInterrupt, BrokenPipeError):
+                raise
+            except Exception as e:
+                # a failed poll is retried from the same cursor on the next round
+                logging.error(f"Error polling logs: {e}")
+
+            time.sleep(self.poll_interval)
+            cursor.extend(self._now() - self.delay_for * 10**9)
+
+    def follow(self, query, start_time, poll=False):
+        if not poll and websocket is not None:
+            # only returns when the websocket could not be opened at all
+            self.follow_websocket(query, start_time)
+            logging.info("Falling back to polling query_range for tail.")
+        self.follow_polling(query, start_time)
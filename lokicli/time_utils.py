@@ -2,8 +2,11 @@
 
 from datetime import datetime, timezone, timedelta
 import re
+import time
 import logging
 
+from .errors import InvalidArgumentError
+
 class LokiTimeUtils:
     @staticmethod
     def utc_to_unix_nanosecond_epoch(utc_timestamp):
@@ -19,12 +22,27 @@ class LokiTimeUtils:
         utc_timestamp = utc_datetime.strftime("%Y-%m-%dT%H:%M:%SZ")
         return utc_timestamp
 
+    @staticmethod
+    def unix_nanosecond_epochs_to_rfc3339(timestamps_nanoseconds):
+        # the lines of a page share a handful of seconds, so every second is formatted only once
+        seconds = {}
+        utc_timestamps = []
+        for timestamp in timestamps_nanoseconds:
+            second, nanoseconds = divmod(int(timestamp), 10**9)
+            prefix = seconds.get(second)
+            if prefix is None:
+                prefix = seconds[second] = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            utc_timestamps.append(f"{prefix}.{nanoseconds:09d}Z")
+        return utc_timestamps
+
     @staticmethod
     def _parse_since(since):
-        if len(since) < 2 or since[-1] not in ["m", "h"]:
-            raise ValueError("Invalid format for since. Specify value in minutes or hours eg: 30m or 1h.")
+        if not isinstance(since, str) or len(since) < 2 or since[-1] not in ["m", "h"]:
+            raise InvalidArgumentError("Invalid format for since. Specify value in minutes or hours eg: 30m or 1h.")
        
         unit = since[-1]
+        if not since[:-1].isdigit():
+            raise InvalidArgumentError("Invalid format for since. Specify value in minutes or hours eg: 30m or 1h.")
         value = int(since[:-1])
 
         if unit == "h":
@@ -32,22 +50,28 @@ class LokiTimeUtils:
         elif unit == "m":
             return timedelta(minutes=value)
         else:
-            raise ValueError("Invalid unit in since. Use 'h' for hours or 'm' for minutes.")
+            raise InvalidArgumentError("Invalid unit in since. Use 'h' for hours or 'm' for minutes.")
 
     @staticmethod
     def _check_from_and_to_times(from_time, to_time):
         if (from_time and not to_time) or (to_time and not from_time):
-            raise ValueError("Both 'from_time' and 'to_time' times must be specified.")
+            raise InvalidArgumentError("Both 'from_time' and 'to_time' times must be specified.")
 
         time_format = r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z"
         if not re.match(time_format, from_time):
-            raise ValueError("Invalid 'from_time'. Correct format is: YYYY-MM-DDTHH:MM:SSZ.")
+            raise InvalidArgumentError("Invalid 'from_time'. Correct format is: YYYY-MM-DDTHH:MM:SSZ.")
         
         if not re.match(time_format, to_time):
-            raise ValueError("Invalid 'to_time'. Correct format is: YYYY-MM-DDTHH:MM:SSZ.")
+            raise InvalidArgumentError("Invalid 'to_time'. Correct format is: YYYY-MM-DDTHH:MM:SSZ.")
         
+        for name, value in (("from_time", from_time), ("to_time", to_time)):
+            try:
+                datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+            except ValueError:
+                raise InvalidArgumentError(f"Invalid '{name}'. Correct format is: YYYY-MM-DDTHH:MM:SSZ.")
+
         if from_time >= to_time:
-            raise ValueError("'from_time' cannot be after 'to_time'.")
+            raise InvalidArgumentError("'from_time' cannot be after 'to_time'.")
 
     def get_from_and_to_times(self, from_time, to_time, since): 
         try:     
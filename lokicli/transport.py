@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import logging
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import LokiConfig
+from .request_policy import RequestPolicy
+from .errors import TransportError
+
+class _NoStoreCookiePolicy(DefaultCookiePolicy):
+    # the auth flow reads the oauth2-proxy cookies from the response headers itself,
+    # so cookies set by responses are never kept in the shared session
+    def set_ok(self, cookie, request):
+        return False
+
+class LokiTransport:
+    def __init__(self, pool_size=32):
+        self.session = requests.Session()
+        self.session.cookies.set_policy(_NoStoreCookiePolicy())
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+
+        # called with no arguments when an api call to the host gets 401 or 302, returns the new cookie
+        self.reauthenticate = {}
+        self.reauthenticate_lock = threading.Lock()
+
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        try:
+            properties = LokiConfig().get_properties()['requestPolicy']
+            self.policy = RequestPolicy(
+                max_retries=int(properties['maxRetries']),
+                base_delay=float(properties['baseDelaySeconds']),
+                max_delay=float(properties['maxDelaySeconds']),
+                rate=float(properties['requestsPerSecond']),
+                burst=int(properties['burst']),
+                max_in_flight=int(properties['maxInFlight']),
+            )
+        except Exception as e:
+            logging.error(f"Error getting request policy: {e}")
+            raise e
+
+    def set_access_token(self, url, access_token):
+        try:
+            domain = urlparse(url).hostname
+            self.session.cookies.set("_oauth2_proxy", access_token, domain=domain)
+        except Exception as e:
+            logging.error(f"Error setting access token cookie: {e}")
+            raise e
+
+    def set_reauthenticate(self, url, reauthenticate):
+        self.reauthenticate[urlparse(url).hostname] = reauthenticate
+
+    def clear_access_token(self, url):
+        try:
+            domain = urlparse(url).hostname
+            self.session.cookies.clear(domain, "/", "_oauth2_proxy")
+        except KeyError:
+            pass
+
+    def get(self, url, params=None, cookies=None, timeout=60, allow_redirects=True):
+        try:
+            return self.policy.send(url, lambda: self.session.get(url, params=params, cookies=cookies, timeout=timeout, allow_redirects=allow_redirects))
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error connecting to {urlparse(url).hostname}: {e}")
+            raise TransportError(f"Error connecting to {urlparse(url).hostname}: {e}") from e
+
+    def get_api(self, url, params=None, timeout=60):
+        # api calls do not follow redirects, oauth2-proxy answers an expired cookie with 401 or a 302 to the login page
+        host = urlparse(url).hostname
+        access_token = self.session.cookies.get("_oauth2_proxy", domain=host)
+        response = self.get(url, params=params, timeout=timeout, allow_redirects=False)
+        if response.status_code not in (401, 302) or host not in self.reauthenticate:
+            return response
+
+        response.close()
+        with self.reauthenticate_lock:
+            # parallel shards that got the same answer log in once, the others retry with the new cookie
+            if self.session.cookies.get("_oauth2_proxy", domain=host) == access_token:
+                logging.warning(f"Got {response.status_code} on {urlparse(url).path}, logging in again.")
+                self.set_access_token(url, self.reauthenticate[host]())
+        return self.get(url, params=params, timeout=timeout, allow_redirects=False)
+
+    def close(self):
+        self.session.close()
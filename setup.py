@@ -17,6 +17,11 @@ setup(
         'urllib3',
         'colorama',
     ],
+    extras_require={
+        'fast': ['orjson'],
+        'tail': ['websocket-client'],
+        'parquet': ['pyarrow'],
+    },
     entry_points={
         'console_scripts': [
             'lokicli = lokicli.lokicli:main',
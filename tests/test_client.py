@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ["HOME"] = tempfile.mkdtemp()
+
+import requests
+
+from lokicli import LokiClient, LokiError, InvalidArgumentError, TransportError, QueryTimeoutError
+from lokicli.transport import LokiTransport
+from lokicli.request_policy import RequestPolicy
+from lokicli.log_reader import LogReader
+
+class FailingSession:
+    # every request fails the way requests does when the gateway cannot be reached
+    def __init__(self, error):
+        self.error = error
+        self.cookies = requests.cookies.RequestsCookieJar()
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        raise self.error
+
+    def close(self):
+        pass
+
+def get_client(error=requests.exceptions.ConnectionError("connection refused"), parallel=1):
+    transport = LokiTransport()
+    transport.policy = RequestPolicy(max_retries=1, base_delay=0, max_delay=0)
+    transport.session = FailingSession(error)
+    with mock.patch.object(LokiClient, "get_url", return_value="https://loki-gateway.s2s.example.com"):
+        client = LokiClient("s2s", transport=transport, parallel=parallel)
+    client.logged_in = True
+    return client
+
+class TestClientErrors(unittest.TestCase):
+    def assertInvalidArgument(self, client, **kwargs):
+        with self.assertRaises(InvalidArgumentError) as raised:
+            list(client.iter_logs("metro-default-prod", **kwargs))
+        self.assertIsInstance(raised.exception, LokiError)
+        self.assertIsInstance(raised.exception, ValueError)
+        # the arguments are checked before anything is sent
+        self.assertEqual(client.transport.session.calls, 0)
+
+    def test_limit_above_the_maximum(self):
+        self.assertInvalidArgument(get_client(), limit=500001)
+
+    def test_invalid_since(self):
+        for since in ("1d", "xh", "h", "", None):
+            with self.subTest(since=since):
+                self.assertInvalidArgument(get_client(), since=since)
+
+    def test_invalid_from_and_to_times(self):
+        for from_time, to_time in (("2024-13-40T00:00:00Z", "2024-01-02T00:00:00Z"), ("2024-01-02T00:00:00Z", "2024-01-01T00:00:00Z"), ("2024-01-01T00:00:00Z", None)):
+            with self.subTest(from_time=from_time, to_time=to_time):
+                self.assertInvalidArgument(get_client(), from_time=from_time, to_time=to_time)
+
+    def test_parallelism_out_of_range(self):
+        for parallel in (0, 33):
+            with self.subTest(parallel=parallel):
+                self.assertInvalidArgument(get_client(parallel=parallel))
+
+    def test_connection_error_after_retries(self):
+        client = get_client()
+        with self.assertRaises(TransportError) as raised:
+            list(client.iter_logs("metro-default-prod"))
+        self.assertIsInstance(raised.exception.__cause__, requests.exceptions.ConnectionError)
+        self.assertEqual(client.transport.session.calls, 2)
+
+        with self.assertRaises(TransportError):
+            client.list_apps(since="24h")
+
+    def test_read_timeout_is_a_query_timeout(self):
+        # a slow query is still split by the log reader instead of failing
+        client = get_client(requests.exceptions.ReadTimeout("read timed out"))
+        logReader = LogReader(client.project, client.url, client.transport)
+        with self.assertRaises(QueryTimeoutError) as raised:
+            logReader.fetch_logs(logReader.build_params(0, 10**9, 100, '{app="metro"}'))
+        self.assertIsInstance(raised.exception.__cause__, TransportError)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import tempfile
+import unittest
+
+os.environ["HOME"] = tempfile.mkdtemp()
+
+from lokicli.log_record import LogRecord
+from lokicli.output import OutputSink
+from lokicli.contextual_logs import ContextualLogs
+
+SECOND = 10**9
+LABELS = {"app": "metro"}
+
+class FakeLogReader:
+    # answers query_range like loki over a fixed list of lines, oldest first
+    def __init__(self, lines, batch_size=250):
+        self.lines = lines
+        self.batch_size = batch_size
+
+    def fetch_logs(self, params):
+        start, end, limit = int(params["start"]), int(params["end"]), int(params["limit"])
+        selected = [item for item in self.lines if start <= item.timestamp < end]
+        if params["direction"] == "BACKWARD":
+            selected.reverse()
+        return selected[:limit]
+
+    def iter_pages(self, start_time, end_time, limit, query):
+        logs = self.fetch_logs({"start": start_time, "end": end_time, "limit": limit, "direction": "BACKWARD"})
+        for start in range(0, len(logs), self.batch_size):
+            yield logs[start:start + self.batch_size]
+
+def print_context(lines, matches, older_context, newer_context, cluster_gap=SECOND, page_size=250):
+    stream = io.BytesIO()
+    contextualLogs = ContextualLogs(OutputSink(stream, color=False))
+    contextualLogs.cluster_gap = cluster_gap
+    pages = [matches[start:start + page_size] for start in range(0, len(matches), page_size)]
+    contextualLogs.print_contextual_logs(pages, FakeLogReader(lines), "", older_context, newer_context, None)
+    contextualLogs.sink.close()
+    return [group.split("\n") for group in stream.getvalue().decode().strip("\n").split("\n\n---\n\n")]
+
+class TestContextualLogs(unittest.TestCase):
+    def test_groups_touching_at_one_timestamp_stay_apart(self):
+        # l106, l107 and l108 share a timestamp, l107 is in neither group and must keep them apart
+        timestamps = {104: -10, 105: -5, 106: 0, 107: 0, 108: 0, 109: 3, 110: 6, 111: 10}
+        lines = [LogRecord(100 * SECOND + offset * SECOND, f"l{number}", LABELS) for number, offset in sorted(timestamps.items())]
+        by_name = {item.line: item for item in lines}
+
+        groups = print_context(lines, [by_name["l111"], by_name["l104"]], 3, 2)
+        self.assertEqual(groups, [["l111", "l110", "l109", "l108"], ["l106", "l105", "l104"]])
+
+    def test_groups_of_neighbouring_clusters_touch(self):
+        lines = [LogRecord(number * 10 * SECOND, f"l{number}", LABELS) for number in range(100, 120)]
+        by_name = {item.line: item for item in lines}
+
+        groups = print_context(lines, [by_name["l115"], by_name["l108"]], 3, 3)
+        self.assertEqual(groups, [[f"l{number}" for number in range(118, 104, -1)]])
+
+    def test_context_continues_across_pages(self):
+        # 1000 matches in pages of 250, clusters and groups run over the page boundaries
+        lines = [LogRecord(number * SECOND, f"l{number}", LABELS) for number in range(5000)]
+        newest_first = list(reversed(lines))
+        matches = newest_first[::5]
+
+        for cluster_gap in (SECOND, 20 * SECOND):
+            groups = print_context(lines, matches, 2, 2, cluster_gap)
+            self.assertEqual(groups, [[item.line for item in newest_first[:4998]]])
+
+        matches = newest_first[::10]
+        groups = print_context(lines, matches, 2, 2, 20 * SECOND)
+        self.assertEqual(groups, [[item.line for item in newest_first[max(0, index - 2):index + 3]] for index in range(0, 5000, 10)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import tempfile
+import unittest
+
+os.environ["HOME"] = tempfile.mkdtemp()
+
+from lokicli.log_record import LogRecord
+from lokicli.log_store import LogStore
+from lokicli.output import OutputSink
+from lokicli.contextual_logs import ContextualLogs
+from lokicli.lokicli import LokiCLI
+
+from test_contextual_logs import SECOND, LABELS, FakeLogReader
+
+class TestStoreContext(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def print_live(self, lines, older_context, newer_context, cluster_gap, page_size=250):
+        # what `logs -q MATCH -o .. -n ..` prints, the matches arrive newest first in pages
+        path = os.path.join(self.directory, "live.txt")
+        matches = [item for item in reversed(lines) if "MATCH" in item.line]
+        pages = [matches[start:start + page_size] for start in range(0, len(matches), page_size)]
+        contextualLogs = ContextualLogs(OutputSink.open(path))
+        contextualLogs.cluster_gap = cluster_gap
+        contextualLogs.print_contextual_logs(pages, FakeLogReader(lines), "", older_context, newer_context, ["MATCH"])
+        contextualLogs.sink.close()
+        with open(path) as file:
+            return file.read()
+
+    def print_store(self, lines, older_context, newer_context):
+        # what `logs --from-store .. -q MATCH -o .. -n ..` prints for a store fetched from the same lines
+        store = os.path.join(self.directory, "store")
+        newest_first = list(reversed(lines))
+        LogStore(store).write([newest_first[start:start + 250] for start in range(0, len(newest_first), 250)], {})
+        path = os.path.join(self.directory, "store.txt")
+        LokiCLI().get_store_logs(store, 500000, None, None, ["MATCH"], False, 0, older_context, newer_context, None, out=path)
+        with open(path) as file:
+            return file.read()
+
+    def test_live_and_store_context_match(self):
+        for seed in range(10):
+            random.seed(seed)
+            # few distinct timestamps, so many lines share one, including the edges of groups
+            timestamps = sorted(random.randrange(0, 600) * SECOND for _ in range(3000))
+            lines = [LogRecord(timestamp, f"line {index}" + (" MATCH" if random.random() < 0.1 else ""), LABELS) for index, timestamp in enumerate(timestamps)]
+            for older_context, newer_context in ((2, 2), (10, 2), (0, 3), (3, 0)):
+                with self.subTest(seed=seed, older_context=older_context, newer_context=newer_context):
+                    cluster_gap = random.choice([SECOND, 5 * SECOND, 60 * SECOND])
+                    self.assertEqual(self.print_live(lines, older_context, newer_context, cluster_gap), self.print_store(lines, older_context, newer_context))
+
+if __name__ == "__main__":
+    unittest.main()